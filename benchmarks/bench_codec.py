@@ -0,0 +1,130 @@
+"""Notification parse throughput before and after the precompiled codecs.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_codec
+"""
+
+import timeit
+from struct import pack, unpack_from
+
+from toiopy.characteristic.specs import IdSpec, MotorSpec, SensorSpec
+from toiopy.data import (
+    Buffer,
+    MotorResponse,
+    MotorResponseData,
+    PositionIdInfo,
+    PositionIdType,
+    SensorType,
+    SensorTypeData,
+)
+
+NUMBER = 200000
+
+POSITION_ID = bytes([0x01, 0x60, 0x01, 0xA0, 0x00, 0x10, 0x00, 0x5E, 0x01, 0x9C, 0x00])
+SENSOR = bytes([0x01, 0x01, 0x00, 0x00, 0x01])
+MOTOR_RESPONSE = bytes([0x84, 0x01, 0x00])
+
+
+class LegacyBuffer:
+    # 旧実装のBuffer: 1バイトごとにpackし直し、フィールドごとにunpack_fromする
+    def __init__(self, byte_data):
+        self._byte_data = byte_data
+        self.bytelength = len(byte_data)
+
+    @classmethod
+    def from_data(cls, data_array):
+        size = len(data_array)
+        return cls(bytearray(pack("B" * size, *data_array)))
+
+    def read_uint8(self, offset):
+        return unpack_from("B", self._byte_data, offset)[0]
+
+    def read_uint16le(self, offset):
+        return unpack_from("<H", self._byte_data, offset)[0]
+
+
+def legacy_parse_position_id(data):
+    buffer = LegacyBuffer.from_data(data)
+    if buffer.bytelength < 1 or buffer.read_uint8(0) != 1:
+        raise ValueError
+    return PositionIdType(
+        buffer,
+        PositionIdInfo(
+            buffer.read_uint16le(1),
+            buffer.read_uint16le(3),
+            buffer.read_uint16le(5),
+            buffer.read_uint16le(7),
+            buffer.read_uint16le(9),
+        ),
+        "id:position-id",
+    )
+
+
+def legacy_parse_sensor(data):
+    buffer = LegacyBuffer.from_data(data)
+    if buffer.read_uint8(0) != 1:
+        raise ValueError
+    return SensorType(
+        buffer,
+        SensorTypeData(
+            buffer.read_uint8(1) == 0,
+            buffer.read_uint8(2) == 1,
+            buffer.read_uint8(3) == 1,
+            buffer.read_uint8(4),
+        ),
+        "sensor:detection",
+    )
+
+
+def legacy_parse_motor_response(data):
+    buffer = LegacyBuffer.from_data(data)
+    if buffer.read_uint8(0) not in (0x83, 0x84):
+        raise ValueError
+    return MotorResponse(
+        buffer, MotorResponseData(buffer.read_uint8(1), buffer.read_uint8(2))
+    )
+
+
+def rate(func) -> float:
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+    return NUMBER / seconds
+
+
+def main():
+    id_spec = IdSpec()
+    sensor_spec = SensorSpec()
+    motor_spec = MotorSpec()
+
+    cases = [
+        (
+            "position-id",
+            lambda: legacy_parse_position_id(POSITION_ID),
+            lambda: id_spec.parse(Buffer.from_data(POSITION_ID)),
+        ),
+        (
+            "sensor",
+            lambda: legacy_parse_sensor(SENSOR),
+            lambda: sensor_spec.parse(Buffer.from_data(SENSOR)),
+        ),
+        (
+            "motor-response",
+            lambda: legacy_parse_motor_response(MOTOR_RESPONSE),
+            lambda: motor_spec.parse(Buffer.from_data(MOTOR_RESPONSE)),
+        ),
+        (
+            "move (encode)",
+            None,
+            lambda: motor_spec.move(100, -100, 500),
+        ),
+    ]
+
+    print("{0:<16}{1:>16}{2:>16}".format("message", "before [/s]", "after [/s]"))
+    for name, before, after in cases:
+        before_rate = "{0:,.0f}".format(rate(before)) if before else "-"
+        after_rate = "{0:,.0f}".format(rate(after))
+        print("{0:<16}{1:>16}{2:>16}".format(name, before_rate, after_rate))
+
+
+if __name__ == "__main__":
+    main()
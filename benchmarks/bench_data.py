@@ -0,0 +1,100 @@
+"""Per-instance memory and creation rate of the notification data types.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_data
+"""
+
+import sys
+import timeit
+import tracemalloc
+
+from toiopy.data import (
+    Buffer,
+    BatteryTypeData,
+    ButtonTypeData,
+    MotorResponseData,
+    PositionIdInfo,
+    PositionIdRecord,
+    PositionIdType,
+    SensorType,
+    SensorTypeData,
+)
+
+NUMBER = 200000
+SAMPLES = 10000
+
+BUFFER = Buffer(bytearray(11))
+# PositionIdType/SensorTypeは中身を共有し、ラッパー自体の大きさだけを測る
+POSITION_ID_INFO = PositionIdInfo(1, 2, 3, 4, 5)
+SENSOR_TYPE_DATA = SensorTypeData(True, False, False, 1)
+
+
+class LegacyPositionIdInfo:
+    # __slots__導入前の__dict__を持つ実装
+    def __init__(self, x, y, angle, sensor_x, sensor_y):
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.sensor_x = sensor_x
+        self.sensor_y = sensor_y
+
+
+class LegacySensorTypeData:
+    def __init__(self, is_sloped, is_collision_detected, is_double_tapped, orientation):
+        self.is_sloped = is_sloped
+        self.is_collision_detected = is_collision_detected
+        self.is_double_tapped = is_double_tapped
+        self.orientation = orientation
+
+
+CASES = [
+    ("PositionIdInfo (legacy)", lambda: LegacyPositionIdInfo(1, 2, 3, 4, 5)),
+    ("PositionIdInfo", lambda: PositionIdInfo(1, 2, 3, 4, 5)),
+    ("PositionIdRecord", lambda: PositionIdRecord(1, 2, 3, 4, 5)),
+    (
+        "PositionIdType",
+        lambda: PositionIdType(BUFFER, POSITION_ID_INFO, "id:position-id"),
+    ),
+    ("SensorTypeData (legacy)", lambda: LegacySensorTypeData(True, False, False, 1)),
+    ("SensorTypeData", lambda: SensorTypeData(True, False, False, 1)),
+    (
+        "SensorType",
+        lambda: SensorType(BUFFER, SENSOR_TYPE_DATA, "sensor:detection"),
+    ),
+    ("MotorResponseData", lambda: MotorResponseData(1, 0)),
+    ("BatteryTypeData", lambda: BatteryTypeData(100)),
+    ("ButtonTypeData", lambda: ButtonTypeData(1, True)),
+]
+
+
+def instance_size(factory) -> float:
+    # 大量に生成して1インスタンスあたりの確保量を測る
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances = [factory() for _ in range(SAMPLES)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    # リスト自体の確保分を差し引く
+    allocated -= sys.getsizeof(instances)
+    return allocated / SAMPLES
+
+
+def creation_rate(factory) -> float:
+    seconds = min(timeit.repeat(factory, number=NUMBER, repeat=3))
+    return NUMBER / seconds
+
+
+def main():
+    print("{0:<26}{1:>14}{2:>16}".format("type", "bytes/inst", "created [/s]"))
+    for name, factory in CASES:
+        print(
+            "{0:<26}{1:>14.1f}{2:>16,.0f}".format(
+                name, instance_size(factory), creation_rate(factory)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
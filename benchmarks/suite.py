@@ -0,0 +1,237 @@
+"""Benchmark suite reporting ops/sec and p50/p99 latency as JSON.
+
+Runs against the in-process simulated provider, so no cube is needed::
+
+    python -m benchmarks.suite --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from toiopy.characteristic import codecs
+from toiopy.characteristic.specs import (
+    BatterySpec,
+    ButtonSpec,
+    IdSpec,
+    LightSpec,
+    MotorSpec,
+    SensorSpec,
+    SoundSpec,
+)
+from toiopy.characteristics import IdCharacteristic
+from toiopy.cube import Cube
+from toiopy.data import (
+    Buffer,
+    LightOperation,
+    MoveToOptions,
+    MoveToTarget,
+    SoundOperation,
+    ToioEventEmitter,
+)
+from toiopy.recorder import KIND_NOTIFY, Recorder
+from toiopy.scenario import LightScenario, SoundScenario
+from toiopy.simulator import SimulatedProvider
+
+POSITION_ID = bytes([0x01, 0x60, 0x01, 0xA0, 0x00, 0x10, 0x00, 0x5E, 0x01, 0x9C, 0x00])
+STANDARD_ID = bytes([0x02, 0x00, 0x00, 0x38, 0x00, 0x5A, 0x00])
+SENSOR = bytes([0x01, 0x01, 0x00, 0x00, 0x01])
+MOTOR_RESPONSE = bytes([0x84, 0x01, 0x00])
+BATTERY = bytes([0x64])
+BUTTON = bytes([0x01, 0x80])
+
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    index = min(int(len(sorted_values) * ratio), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], operations: int, elapsed: float) -> Dict:
+    latencies = sorted(latencies)
+    return {
+        "ops_per_sec": operations / elapsed if elapsed > 0 else 0.0,
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "samples": len(latencies),
+    }
+
+
+def timer_overhead(samples: int = 10000) -> float:
+    # 1回ずつ計測するときにperf_counter自体にかかる時間の中央値
+    overheads = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        overheads.append(time.perf_counter() - started)
+    return sorted(overheads)[samples // 2]
+
+
+def measure(
+    func: Callable, batch: int = 1000, batches: int = 200, samples: int = 10000
+) -> Dict:
+    # ops/secは計測の影響を受けないようまとめて計測し、p50/p99は1回ずつ計測する
+    # 1回ずつの計測からはperf_counterの呼び出しにかかる時間を差し引く
+    for _ in range(batch):
+        func()
+    operations = batch * batches
+    started = time.perf_counter()
+    for _ in range(operations):
+        func()
+    elapsed = time.perf_counter() - started
+
+    overhead = timer_overhead()
+    latencies = []
+    for _ in range(samples):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(max(time.perf_counter() - call_started - overhead, 0.0))
+    return summarize(latencies, operations, elapsed)
+
+
+def measure_each(func: Callable, count: int) -> Dict:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, count, time.perf_counter() - started)
+
+
+def bench_spec_parse(results: Dict):
+    battery, button, sensor = BatterySpec(), ButtonSpec(), SensorSpec()
+    id_spec, motor = IdSpec(), MotorSpec()
+    cases = {
+        "battery": lambda: battery.parse(Buffer.from_data(BATTERY)),
+        "button": lambda: button.parse(Buffer.from_data(BUTTON)),
+        "id.position_id": lambda: id_spec.parse(Buffer.from_data(POSITION_ID)),
+        "id.standard_id": lambda: id_spec.parse(Buffer.from_data(STANDARD_ID)),
+        "sensor": lambda: sensor.parse(Buffer.from_data(SENSOR)),
+        "motor.response": lambda: motor.parse(Buffer.from_data(MOTOR_RESPONSE)),
+    }
+    for name, func in cases.items():
+        results["spec.parse." + name] = measure(func)
+
+
+def bench_spec_build(results: Dict):
+    motor, light, sound = MotorSpec(), LightSpec(), SoundSpec()
+    light_operations = [LightOperation(100, 255, 0, 0)] * 10
+    sound_operations = [SoundOperation(100, 60)] * 10
+    targets = [MoveToTarget(100, 100, None, None)] * 29
+    options = MoveToOptions(0, 80, 0, 0, True)
+    cases = {
+        "motor.move": lambda: motor.move(100, -100, 500),
+        "motor.move_to": lambda: motor.move_to(targets, options),
+        "light.turn_on_light": lambda: light.turn_on_light(light_operations[0]),
+        "light.scenario": lambda: light.turn_on_light_with_scenario(
+            light_operations, 1
+        ),
+        "sound.play_sound": lambda: sound.play_sound(sound_operations, 1),
+        "light.scenario.cached": lambda: LightScenario.cached(light_operations, 1),
+        "sound.play_sound.cached": lambda: SoundScenario.cached(sound_operations, 1),
+    }
+    for name, func in cases.items():
+        results["spec.build." + name] = measure(func)
+
+
+def bench_buffer(results: Dict):
+    buffer = Buffer.from_data(POSITION_ID)
+    values = list(POSITION_ID)
+    results["buffer.decode.read_uint16le"] = measure(lambda: buffer.read_uint16le(1))
+    results["buffer.decode.unpack"] = measure(lambda: buffer.unpack(codecs.POSITION_ID))
+    results["buffer.encode.from_data"] = measure(lambda: Buffer.from_data(values))
+    results["buffer.encode.pack"] = measure(
+        lambda: Buffer.pack(codecs.MOVE, 2, 1, 1, 100, 2, 2, 100, 50)
+    )
+
+
+def bench_emitter(results: Dict):
+    for listeners in (1, 10, 100):
+        emitter = ToioEventEmitter()
+        for _ in range(listeners):
+            emitter.on("id:position-id", lambda data: None)
+        results["emitter.fanout.{0}".format(listeners)] = measure(
+            lambda: emitter.emit("id:position-id", None),
+            batch=max(1000 // listeners, 10),
+        )
+
+
+def bench_recorder(results: Dict):
+    fd, path = tempfile.mkstemp(suffix=".rec")
+    os.close(fd)
+    try:
+        with Recorder(path) as recorder:
+            channel = recorder.channel("bench", IdCharacteristic.UUID)
+            results["recorder.record"] = measure(
+                lambda: recorder.record(KIND_NOTIFY, channel, POSITION_ID)
+            )
+    finally:
+        os.remove(path)
+
+
+def bench_cube(results: Dict, connects: int):
+    provider = SimulatedProvider(cube_count=1, position_id_rate_hz=0, sensor_rate_hz=0)
+    provider.initialize()
+    try:
+        cube = Cube(provider.devices[0])
+
+        def connect():
+            cube.connect()
+            cube.disconnect()
+
+        results["cube.connect"] = measure_each(connect, connects)
+        cube.connect()
+
+        results["cube.move"] = measure(
+            lambda: cube.move(100, 100, 0), batch=100, samples=2000
+        )
+        # durationを指定すると完了の予約と、前のmoveの予約の取り消しが加わる
+        results["cube.move.duration"] = measure(
+            lambda: cube.move(100, 100, 500), batch=100, samples=2000
+        )
+
+        targets = [MoveToTarget(100, 100, None, None)]
+        provider.move_to_target_ms = 0
+        results["cube.move_to.round_trip"] = measure_each(
+            lambda: cube.move_to(targets).result(timeout=1), 500
+        )
+
+        cube.disconnect()
+    finally:
+        provider.shutdown()
+
+
+def main(argv: List[str] = sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="write JSON to this file instead of stdout")
+    parser.add_argument("--connects", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    results: Dict = {}
+    bench_spec_parse(results)
+    bench_spec_build(results)
+    bench_buffer(results)
+    bench_emitter(results)
+    bench_recorder(results)
+    bench_cube(results, args.connects)
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
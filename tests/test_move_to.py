@@ -0,0 +1,85 @@
+import pytest
+
+from toiopy.cube import Cube
+from toiopy.characteristics import MoveToFuture
+from toiopy.data import MoveToOptions, MoveToTarget
+from toiopy.simulator import SimulatedProvider
+
+
+@pytest.fixture
+def provider():
+    provider = SimulatedProvider(
+        cube_count=1, position_id_rate_hz=0, sensor_rate_hz=0, move_to_target_ms=1
+    )
+    provider.initialize()
+    yield provider
+    provider.shutdown()
+
+
+def connect(provider, on_write=None):
+    # on_writeはモーターへの書き込みごとに呼ばれ、例外を投げると書き込みが失敗する
+    device = provider.devices[0]
+    writes = []
+    simulate = device._motor_characteristic._on_write
+
+    def record(value):
+        writes.append(bytes(value))
+        if on_write is not None:
+            on_write(len(writes))
+        simulate(value)
+
+    device._motor_characteristic._on_write = record
+    cube = Cube(device)
+    cube.connect()
+    return cube, writes
+
+
+def targets(count):
+    return [MoveToTarget(100 + i, 100, None, None) for i in range(count)]
+
+
+def test_long_paths_are_sent_in_appended_chunks(provider):
+    cube, writes = connect(provider)
+
+    future = cube.move_to(targets(60), MoveToOptions(0, 80, 0, 0, True))
+
+    assert future.result(timeout=3) == MoveToFuture.REASON_SUCCESS
+    # 29目標ずつに分け、2つ目以降は追加書き込みにする
+    assert [(len(value) - 8) // 6 for value in writes] == [29, 29, 2]
+    assert [value[7] for value in writes] == [0, 1, 1]
+
+
+def test_append_option_applies_to_the_first_chunk(provider):
+    cube, writes = connect(provider)
+
+    future = cube.move_to(targets(3), MoveToOptions(0, 80, 0, 0, False))
+
+    assert future.result(timeout=3) == MoveToFuture.REASON_SUCCESS
+    assert [value[7] for value in writes] == [1]
+
+
+def test_failed_chunk_write_completes_the_future(provider):
+    def fail_third(count):
+        if count == 3:
+            raise RuntimeError("link lost")
+
+    cube, writes = connect(provider, fail_third)
+
+    future = cube.move_to(targets(90), MoveToOptions(0, 80, 0, 0, True))
+
+    with pytest.raises(RuntimeError):
+        future.result(timeout=3)
+    assert future._on_response not in cube._event_emitter.listeners("motor:response")
+
+
+def test_failed_first_write_completes_the_future(provider):
+    def fail(count):
+        raise RuntimeError("link lost")
+
+    cube, _ = connect(provider, fail)
+
+    future = cube.move_to(targets(3), MoveToOptions(0, 80, 0, 0, True))
+
+    assert isinstance(future.exception(timeout=0), RuntimeError)
+    assert future._on_response not in cube._event_emitter.listeners("motor:response")
+    assert cube._motor_characteristic._pending is None
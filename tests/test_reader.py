@@ -0,0 +1,58 @@
+import os
+from unittest import mock
+
+import pytest
+
+from toiopy.characteristic import codecs
+from toiopy.characteristics import IdCharacteristic
+from toiopy.recorder import KIND_NOTIFY, Recorder
+
+np = pytest.importorskip("numpy")
+from toiopy.reader import RecordingReader  # noqa: E402
+
+
+def record(path, cube_id, frames):
+    # framesは(timestamp, x)の列
+    with mock.patch("toiopy.recorder.time.time") as now, Recorder(path) as recorder:
+        now.return_value = frames[0][0]
+        channel = recorder.channel(cube_id, IdCharacteristic.UUID)
+        for timestamp, x in frames:
+            now.return_value = timestamp
+            recorder.record(
+                KIND_NOTIFY, channel, codecs.POSITION_ID.pack(1, x, 0, 0, 0, 0)
+            )
+
+
+def test_positions_include_timestamps_tied_across_blocks(tmp_path):
+    path = str(tmp_path / "tied.rec")
+    record(path, "cube", [(99.0, 0)] + [(100.0, x) for x in range(1, 11)])
+
+    with RecordingReader(path, cache_index=False, time_index_stride=4) as reader:
+        positions = reader.positions(start=100.0)
+        assert list(positions["x"]) == list(range(1, 11))
+        assert len(reader.positions(start=99.0, end=100.0)) == 1
+
+
+def test_index_is_rebuilt_when_the_log_is_replaced(tmp_path):
+    path = str(tmp_path / "replaced.rec")
+    record(path, "first", [(float(i), i) for i in range(10)])
+    with RecordingReader(path) as reader:
+        assert len(reader.positions()) == 10
+
+    # 古い索引のフレーム位置が新しいファイルのペイロードの途中を指す
+    os.remove(path)
+    record(path, "cube-0002", [(float(i), i) for i in range(50)])
+    with RecordingReader(path) as reader:
+        assert reader.cube_ids == ["cube-0002"]
+        assert list(reader.positions()["x"]) == list(range(50))
+
+
+def test_index_is_extended_when_the_log_is_appended(tmp_path):
+    path = str(tmp_path / "appended.rec")
+    record(path, "cube", [(float(i), i) for i in range(10)])
+    with RecordingReader(path) as reader:
+        assert len(reader.positions()) == 10
+
+    record(path, "cube", [(float(i), i) for i in range(10, 25)])
+    with RecordingReader(path) as reader:
+        assert list(reader.positions()["x"]) == list(range(25))
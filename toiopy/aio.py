@@ -0,0 +1,242 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, List, Optional, Union
+
+from toiopy.cube import Cube
+from toiopy.data import (
+    MoveToOptions,
+    MoveToTarget,
+    LightOperation,
+    SoundOperation,
+    ButtonTypeData,
+    BatteryTypeData,
+    SensorTypeData,
+)
+from toiopy.scanner import Scanner, NearestScanner
+from toiopy.scenario import LightScenario, SoundScenario
+
+
+class EventBridge:
+    # BLEスレッドから呼ばれるコールバックをイベントループ上で実行する
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def wrap(self, listener: Callable) -> Callable:
+        def bridged(*args):
+            self._loop.call_soon_threadsafe(self._dispatch, listener, args)
+
+        return bridged
+
+    def queue(self, queue: asyncio.Queue) -> Callable:
+        def bridged(*args):
+            self._loop.call_soon_threadsafe(self._put, queue, args)
+
+        return bridged
+
+    def _dispatch(self, listener: Callable, args: tuple):
+        result = listener(*args)
+        if asyncio.iscoroutine(result):
+            self._loop.create_task(result)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, args: tuple):
+        # 溢れた場合は古いイベントを捨てる
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(EventBridge._to_event(args))
+
+    @staticmethod
+    def _to_event(args: tuple) -> Any:
+        if not args:
+            return None
+        if len(args) == 1:
+            return args[0]
+        return args
+
+
+class AsyncCube:
+    def __init__(self, cube: Cube, executor: Optional[Executor] = None):
+        self._cube = cube
+        self._executor = executor
+        self._listeners: dict = {}
+
+    @property
+    def id(self):
+        return self._cube.id
+
+    @property
+    def cube(self) -> Cube:
+        return self._cube
+
+    async def connect(self):
+        await self._run(self._cube.connect)
+        return self
+
+    async def disconnect(self):
+        await self._run(self._cube.disconnect)
+
+    def on(
+        self,
+        event: str,
+        listener: Callable,
+        min_interval_ms: float = 0,
+        only_on_change: bool = False,
+        predicate: Optional[Callable[..., bool]] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        # フィルタは通知スレッド側で適用し、通過したものだけをループへ渡す
+        # loopを省略した場合は実行中のループに渡す。ループの外では指定が必要
+        bridge = EventBridge(loop or asyncio.get_running_loop())
+        bridged = bridge.wrap(listener)
+        self._listeners.setdefault((event, listener), []).append(bridged)
+        self._cube.on(event, bridged, min_interval_ms, only_on_change, predicate)
+        return self
+
+    def off(self, event: str, listener: Callable):
+        # 同じlistenerを複数回登録した場合は全て外す
+        for bridged in self._listeners.pop((event, listener), []):
+            self._cube.off(event, bridged)
+        return self
+
+    async def events(self, event: str, maxsize: int = 0) -> AsyncIterator[Any]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize)
+        bridged = EventBridge(asyncio.get_running_loop()).queue(queue)
+        self._cube.on(event, bridged)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._cube.off(event, bridged)
+
+    # Motor Control
+    async def move(
+        self,
+        left: int,
+        right: int,
+        duration: int,
+        without_response: Optional[bool] = None,
+    ) -> bool:
+        future = await self._run(
+            self._cube.move, left, right, duration, without_response
+        )
+        return await asyncio.wrap_future(future)
+
+    async def move_to(
+        self,
+        targets: List[MoveToTarget],
+        options: MoveToOptions = MoveToOptions(0, 115, 0, 0, True),
+    ) -> int:
+        future = await self._run(self._cube.move_to, targets, options)
+        return await asyncio.wrap_future(future)
+
+    async def stop(self) -> bool:
+        future = await self._run(self._cube.stop)
+        return await asyncio.wrap_future(future)
+
+    # LED
+    async def turn_on_light(
+        self, operation: LightOperation, without_response: Optional[bool] = None
+    ) -> bool:
+        future = await self._run(self._cube.turn_on_light, operation, without_response)
+        return await asyncio.wrap_future(future)
+
+    async def turn_on_light_with_scenario(
+        self,
+        operations: Union[List[LightOperation], LightScenario],
+        repeat_count: int = 0,
+    ) -> bool:
+        future = await self._run(
+            self._cube.turn_on_light_with_scenario, operations, repeat_count
+        )
+        return await asyncio.wrap_future(future)
+
+    async def turn_off_light(self):
+        await self._run(self._cube.turn_off_light)
+
+    # Sound
+    async def play_preset_sound(self, sound_id: int) -> bool:
+        future = await self._run(self._cube.play_preset_sound, sound_id)
+        return await asyncio.wrap_future(future)
+
+    async def play_sound(
+        self,
+        operations: Union[List[SoundOperation], SoundScenario],
+        repeat_count: int = 0,
+    ) -> bool:
+        future = await self._run(self._cube.play_sound, operations, repeat_count)
+        return await asyncio.wrap_future(future)
+
+    async def stop_sound(self):
+        await self._run(self._cube.stop_sound)
+
+    # Sensor
+    async def get_sensor_snapshot(
+        self, max_age_ms: Optional[float] = None
+    ) -> SensorTypeData:
+        return await self._run(self._cube.get_sensor_snapshot, max_age_ms)
+
+    async def get_slope_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[SensorTypeData]:
+        return await self._run(self._cube.get_slope_status, max_age_ms)
+
+    async def get_collision_status(self) -> Optional[SensorTypeData]:
+        return await self._run(self._cube.get_collision_status)
+
+    async def get_double_tap_status(self) -> Optional[SensorTypeData]:
+        return await self._run(self._cube.get_double_tap_status)
+
+    async def get_orientation(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[SensorTypeData]:
+        return await self._run(self._cube.get_orientation, max_age_ms)
+
+    # button
+    async def get_button_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[ButtonTypeData]:
+        return await self._run(self._cube.get_button_status, max_age_ms)
+
+    # battery
+    async def get_battery_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[BatteryTypeData]:
+        return await self._run(self._cube.get_battery_status, max_age_ms)
+
+    # configuration
+    async def get_ble_protocol_version(self):
+        return await self._run(self._cube.get_ble_protocol_version)
+
+    async def set_collision_threshold(self, threshold: int):
+        await self._run(self._cube.set_collision_threshold, threshold)
+
+    async def _run(self, func: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+
+class AsyncScanner:
+    def __init__(self, scanner: Scanner, executor: Optional[Executor] = None):
+        self._scanner = scanner
+        self._executor = executor
+
+    async def start(self) -> Union[AsyncCube, List[AsyncCube]]:
+        loop = asyncio.get_running_loop()
+        ret = await loop.run_in_executor(self._executor, self._scanner.start)
+        if isinstance(ret, list):
+            return [AsyncCube(cube, self._executor) for cube in ret]
+        return AsyncCube(ret, self._executor)
+
+
+class AsyncNearestScanner(AsyncScanner):
+    def __init__(
+        self,
+        provider,
+        scan_window_ms: int = NearestScanner.SCAN_WINDOW_MS,
+        timeout_ms: int = Scanner.DEFAULT_TIMEOUT_MS,
+        executor: Optional[Executor] = None,
+    ):
+        super(AsyncNearestScanner, self).__init__(
+            NearestScanner(provider, scan_window_ms, timeout_ms), executor
+        )
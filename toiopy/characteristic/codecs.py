@@ -0,0 +1,36 @@
+from functools import lru_cache
+from struct import Struct
+
+UINT8 = Struct("<B")
+UINT16LE = Struct("<H")
+UINT32LE = Struct("<I")
+
+# notification
+BATTERY = Struct("<B")
+BUTTON = Struct("<BB")
+POSITION_ID = Struct("<BHHHHH")
+POSITION_ID_FIELDS = Struct("<HHHHH")
+STANDARD_ID = Struct("<BIH")
+SENSOR = Struct("<BBBBB")
+MOTOR_RESPONSE = Struct("<BBB")
+
+# command
+MOVE = Struct("<8B")
+TURN_ON_LIGHT = Struct("<7B")
+PLAY_PRESET_SOUND = Struct("<3B")
+
+
+# 可変長のコマンドは要素数ごとにStructをキャッシュする
+@lru_cache(maxsize=None)
+def move_to(num_targets: int) -> Struct:
+    return Struct("<8B" + "3H" * num_targets)
+
+
+@lru_cache(maxsize=None)
+def turn_on_light_with_scenario(num_operations: int) -> Struct:
+    return Struct("<3B" + "6B" * num_operations)
+
+
+@lru_cache(maxsize=None)
+def play_sound(num_operations: int) -> Struct:
+    return Struct("<3B" + "3B" * num_operations)
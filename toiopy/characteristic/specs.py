@@ -35,6 +35,7 @@ from toiopy.data import (
     StopSoundType,
     ToioException,
 )
+from toiopy.characteristic import codecs
 from toiopy.util import clamp
 from toiopy.tag import createTagHandler
 
@@ -44,7 +45,7 @@ class BatterySpec:
         if buffer.bytelength < 1:
             raise ToioException("parse error")
 
-        level = buffer.read_uint8(0)
+        (level,) = buffer.unpack(codecs.BATTERY)
         data = BatteryTypeData(level)
         return BatteryType(buffer, data, "battery:battery")
 
@@ -54,13 +55,12 @@ class ButtonSpec:
         if buffer.bytelength < 2:
             raise ToioException("parse error")
 
-        id = buffer.read_uint8(0)
+        id, pressed = buffer.unpack(codecs.BUTTON)
 
         if id != 1:
             raise ToioException("parse error")
 
-        pressed = buffer.read_uint8(1) != 0
-        data = ButtonTypeData(id, pressed)
+        data = ButtonTypeData(id, pressed != 0)
         return ButtonType(buffer, data, "button:press")
 
 
@@ -77,32 +77,26 @@ class IdSpec:
             if buffer.bytelength < 11:
                 raise ToioException("parse error")
             else:
+                _, x, y, angle, sensor_x, sensor_y = buffer.unpack(codecs.POSITION_ID)
                 return PositionIdType(
                     buffer,
-                    PositionIdInfo(
-                        buffer.read_uint16le(1),
-                        buffer.read_uint16le(3),
-                        buffer.read_uint16le(5),
-                        buffer.read_uint16le(7),
-                        buffer.read_uint16le(9),
-                    ),
+                    PositionIdInfo(x, y, angle, sensor_x, sensor_y),
                     "id:position-id",
                 )
         elif data_type == 2:
             if buffer.bytelength < 7:
                 raise ToioException("parse error")
             else:
+                _, standard_id, angle = buffer.unpack(codecs.STANDARD_ID)
                 return StandardIdType(
                     buffer,
-                    StandardIdInfo(
-                        StandardId(buffer.read_uint32le(1)), buffer.read_uint16le(5)
-                    ),
+                    StandardIdInfo(StandardId(standard_id), angle),
                     "id:standard-id",
                 )
         elif data_type == 3:
             return IdMissedType(buffer, "id:position-id-missed")
 
-        elif data_type == 2:
+        elif data_type == 4:
             return IdMissedType(buffer, "id:standard-id-missed")
         else:
             raise ToioException("parse error")
@@ -115,9 +109,9 @@ class LightSpec:
         green = clamp(operation.green, 0, 255)
         blue = clamp(operation.blue, 0, 255)
 
-        data_list = [3, duration, 1, 1, red, green, blue]
+        buffer = Buffer.pack(codecs.TURN_ON_LIGHT, 3, duration, 1, 1, red, green, blue)
         data = LightOperation(duration * 10, red, green, blue)
-        return TurnOnLightType(Buffer.from_data(data_list), data)
+        return TurnOnLightType(buffer, data)
 
     def turn_on_light_with_scenario(
         self, operations: List[LightOperation], repeat_count: int
@@ -127,10 +121,7 @@ class LightSpec:
         )
 
         num_operations = min(len(operations), 29)
-        buffer = Buffer.alloc(3 + 6 * num_operations)
-        buffer.write_uint8(4, 0)
-        buffer.write_uint8(arrange_data.repeat_count, 1)
-        buffer.write_uint8(num_operations, 2)
+        values = [4, arrange_data.repeat_count, num_operations]
 
         total_duration_ms = 0
 
@@ -147,17 +138,15 @@ class LightSpec:
                 LightOperation(duration * 10, red, green, blue)
             )
 
-            buffer.write_uint8(duration, 3 + 6 * i)
-            buffer.write_uint8(1, 4 + 6 * i)
-            buffer.write_uint8(1, 5 + 6 * i)
-            buffer.write_uint8(red, 6 + 6 * i)
-            buffer.write_uint8(green, 7 + 6 * i)
-            buffer.write_uint8(blue, 8 + 6 * i)
+            values += [duration, 1, 1, red, green, blue]
 
         arrange_data.total_duration_ms = (
             total_duration_ms * 10 * arrange_data.repeat_count
         )
 
+        buffer = Buffer.pack(
+            codecs.turn_on_light_with_scenario(num_operations), *values
+        )
         return TurnOnLightWithScenarioType(buffer, arrange_data)
 
     def turn_off_light(self) -> TurnOffLightType:
@@ -176,10 +165,10 @@ class MotorSpec:
         if buffer.bytelength != 3:
             raise ToioException("parse error")
 
-        type_data = buffer.read_uint8(0)
+        type_data, operation_id, reason = buffer.unpack(codecs.MOTOR_RESPONSE)
 
         if type_data == 0x83 or type_data == 0x84:
-            data = MotorResponseData(buffer.read_uint8(1), buffer.read_uint8(2))
+            data = MotorResponseData(operation_id, reason)
             return MotorResponse(buffer, data)
         else:
             raise ToioException("parse error")
@@ -195,8 +184,8 @@ class MotorSpec:
         r_power = min(abs(right), MotorSpec.MAX_SPEED)
 
         duration = clamp(int(duration_ms / 10), 0, 255)
-        buffer = Buffer.from_data(
-            [2, 1, l_direction, l_power, 2, r_direction, r_power, duration]
+        buffer = Buffer.pack(
+            codecs.MOVE, 2, 1, l_direction, l_power, 2, r_direction, r_power, duration
         )
 
         data = MoveTypeData(l_sign * l_power, r_sign * r_power, duration * 10)
@@ -208,15 +197,16 @@ class MotorSpec:
 
         operation_id = self._tag.next()
         num_targets = min(len(targets), MotorSpec.NUMBER_OF_TARGETS_PER_OPERATION)
-        buffer = Buffer.alloc(8 + 6 * num_targets)
-        buffer.write_uint8(4, 0)
-        buffer.write_uint8(operation_id, 1)
-        buffer.write_uint8(options.timeout, 2)
-        buffer.write_uint8(options.move_type, 3)
-        buffer.write_uint8(options.max_speed, 4)
-        buffer.write_uint8(options.speed_type, 5)
-        buffer.write_uint8(0, 6)
-        buffer.write_uint8(0 if options.overwrite else 1, 7)
+        values = [
+            4,
+            operation_id,
+            options.timeout,
+            options.move_type,
+            options.max_speed,
+            options.speed_type,
+            0,
+            0 if options.overwrite else 1,
+        ]
 
         for i in range(num_targets):
             target: MoveToTarget = targets[i]
@@ -229,10 +219,9 @@ class MotorSpec:
             if target.angle is None and target.rotate_type != 0x06:
                 rotate_type = 0x05
 
-            buffer.write_uint16le(x, 8 + 6 * i)
-            buffer.write_uint16le(y, 10 + 6 * i)
-            buffer.write_uint16le((rotate_type << 13) | angle, 12 + 6 * i)
+            values += [x, y, (rotate_type << 13) | angle]
 
+        buffer = Buffer.pack(codecs.move_to(num_targets), *values)
         options.operation_id = operation_id
         data = MoveToTypeData(targets[0:num_targets], options)
         return MoveToType(buffer, data)
@@ -240,21 +229,18 @@ class MotorSpec:
 
 class SensorSpec:
     def parse(self, buffer: Buffer) -> SensorType:
-        if buffer.bytelength < 3:
+        if buffer.bytelength < codecs.SENSOR.size:
             raise ToioException("parse error")
 
-        type_data = buffer.read_uint8(0)
+        type_data, horizontal, collision, double_tap, orientation = buffer.unpack(
+            codecs.SENSOR
+        )
 
         if type_data != 1:
             raise ToioException("parse error")
 
-        is_sloped = buffer.read_uint8(1) == 0
-        is_collision_detected = buffer.read_uint8(2) == 1
-        is_double_tapped = buffer.read_uint8(3) == 1
-        orientation = buffer.read_uint8(4)
-
         data = SensorTypeData(
-            is_sloped, is_collision_detected, is_double_tapped, orientation
+            horizontal == 0, collision == 1, double_tap == 1, orientation
         )
 
         return SensorType(buffer, data, "sensor:detection")
@@ -264,7 +250,8 @@ class SoundSpec:
     def play_preset_sound(self, sound_id: int) -> PlayPresetSoundType:
         arranged_sound_id = clamp(sound_id, 0, 10)
         data = PlayPresetSoundTypeData(sound_id)
-        return PlayPresetSoundType(Buffer.from_data([2, arranged_sound_id, 255]), data)
+        buffer = Buffer.pack(codecs.PLAY_PRESET_SOUND, 2, arranged_sound_id, 255)
+        return PlayPresetSoundType(buffer, data)
 
     def play_sound(
         self, operations: List[SoundOperation], repeat_count: int
@@ -273,10 +260,7 @@ class SoundSpec:
 
         num_operations = min(len(operations), 59)
 
-        buffer = Buffer.alloc(3 + 3 * num_operations)
-        buffer.write_uint8(3, 0)
-        buffer.write_uint8(arrange_data.repeat_count, 1)
-        buffer.write_uint8(num_operations, 2)
+        values = [3, arrange_data.repeat_count, num_operations]
 
         total_duration_ms = 0
 
@@ -289,14 +273,14 @@ class SoundSpec:
             data = SoundOperation(duration * 10, note_name)
             arrange_data.operations.append(data)
 
-            buffer.write_uint8(duration, 3 + 3 * i)
-            buffer.write_uint8(note_name, 4 + 3 * i)
-            buffer.write_uint8(255, 5 + 3 * i)
+            values += [duration, note_name, 255]
 
         arrange_data.total_duration_ms = (
             total_duration_ms * 10 * arrange_data.repeat_count
         )
 
+        buffer = Buffer.pack(codecs.play_sound(num_operations), *values)
+
         return PlaySoundType(buffer, arrange_data)
 
     def stop_sound(self) -> StopSoundType:
@@ -1,8 +1,12 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from queue import Empty
 from uuid import UUID
-from typing import List, Optional, Union
-
-from Adafruit_BluefruitLE.interfaces.gatt import GattCharacteristic
+from typing import Callable, Dict, List, Optional, Union
 
+from toiopy.characteristic import codecs
 from toiopy.characteristic.specs import (
     BatterySpec,
     ButtonSpec,
@@ -20,53 +24,81 @@ from toiopy.data import (
     BatteryTypeData,
     ButtonType,
     ButtonTypeData,
+    PositionIdRecord,
     PositionIdType,
     StandardIdType,
     IdMissedType,
     LightOperation,
     TurnOnLightType,
-    TurnOnLightWithScenarioType,
     TurnOffLightType,
     MotorResponse,
+    MotorResponseData,
     MoveType,
     MoveToTarget,
+    MoveToType,
     MoveToOptions,
     SensorType,
     SensorTypeData,
     SoundOperation,
     PlayPresetSoundType,
-    PlaySoundType,
     StopSoundType,
 )
-from toiopy.util import set_timeout, clear_timeout
+from toiopy.metrics import CubeMetrics
+from toiopy.provider import GattCharacteristic
+from toiopy.scenario import LightScenario, SoundScenario
+from toiopy.state import StateCache
+from toiopy.telemetry import PositionRingBuffer
+from toiopy.util import TimeoutFuture, call_later, parse_version
+from toiopy.writer import CharacteristicWriter
+
+logger = logging.getLogger(__name__)
 
 
 class BatteryCharacteristic:
     UUID = UUID("10b201085b3b45719508cf3efcd7bbae")
+    EVENTS = ("battery:battery",)
 
     def __init__(
-        self, characteristic: GattCharacteristic, event_emitter: ToioEventEmitter
+        self,
+        characteristic: GattCharacteristic,
+        event_emitter: ToioEventEmitter,
+        metrics: Optional[CubeMetrics] = None,
+        state: Optional[StateCache] = None,
     ):
         self._characteristic: GattCharacteristic = characteristic
-        self._characteristic.start_notify(self._on_data)
         self._event_emitter: ToioEventEmitter = event_emitter
         self._spec: BatterySpec = BatterySpec()
+        self._metrics = metrics or CubeMetrics()
+        self._state = state or StateCache(None)
+        self.subscribe()
+
+    def subscribe(self):
+        self._characteristic.start_notify(self._on_data)
 
     def _on_data(self, data):
+        self._metrics.increment(CubeMetrics.NOTIFICATIONS)
+        self._state.update(StateCache.BATTERY, data)
+        if not self._event_emitter.accepts("battery:battery"):
+            return
         try:
             buffer = Buffer.from_data(data)
             parsed_data: BatteryType = self._spec.parse(buffer)
             self._event_emitter.emit("battery:battery", parsed_data.data)
         except Exception as e:
-            print(e)
+            self._metrics.increment(CubeMetrics.PARSE_ERRORS)
+            logger.warning("failed to handle battery notification: %s", e)
 
-    def get_battery_status(self) -> Optional[BatteryTypeData]:
-        data: Optional[BatteryType] = self._read()
+    def get_battery_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[BatteryTypeData]:
+        data: Optional[BatteryType] = self._read(max_age_ms)
         return data.data if data is not None else None
 
-    def _read(self) -> Optional[BatteryType]:
+    def _read(self, max_age_ms: Optional[float] = None) -> Optional[BatteryType]:
         try:
-            data = self._characteristic.read_value()
+            data = self._state.read(
+                StateCache.BATTERY, self._characteristic, max_age_ms
+            )
 
             if not data:
                 return None
@@ -74,35 +106,55 @@ class BatteryCharacteristic:
             parsed_data = self._spec.parse(Buffer(data))
             return parsed_data
         except Exception as e:
-            print(e)
+            logger.warning("failed to read battery: %s", e)
             return None
 
 
 class ButtonCharacteristic:
     UUID = UUID("10b201075b3b45719508cf3efcd7bbae")
+    EVENTS = ("button:press",)
+    # ボタンが押された/離されたときだけ通知される
+    CHANGE_EVENTS = ("button:press",)
 
     def __init__(
-        self, characteristic: GattCharacteristic, eventEmitter: ToioEventEmitter
+        self,
+        characteristic: GattCharacteristic,
+        eventEmitter: ToioEventEmitter,
+        metrics: Optional[CubeMetrics] = None,
+        state: Optional[StateCache] = None,
     ):
         self._characteristic: GattCharacteristic = characteristic
         self._event_emitter = eventEmitter
         self._spec: ButtonSpec = ButtonSpec()
+        self._metrics = metrics or CubeMetrics()
+        self._state = state or StateCache(None)
+        self.subscribe()
+
+    def subscribe(self):
+        self._characteristic.start_notify(self._on_data)
 
     def _on_data(self, data):
+        self._metrics.increment(CubeMetrics.NOTIFICATIONS)
+        self._state.update(StateCache.BUTTON, data)
+        if not self._event_emitter.accepts("button:press"):
+            return
         try:
             buffer = Buffer.from_data(data)
             parsed_data: ButtonType = self._spec.parse(buffer)
             self._event_emitter.emit("button:press", parsed_data.data)
         except Exception as e:
-            print(e)
+            self._metrics.increment(CubeMetrics.PARSE_ERRORS)
+            logger.warning("failed to handle button notification: %s", e)
 
-    def get_button_status(self) -> Optional[ButtonTypeData]:
-        data: Optional[ButtonType] = self._read()
+    def get_button_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[ButtonTypeData]:
+        data: Optional[ButtonType] = self._read(max_age_ms)
         return data.data if data is not None else None
 
-    def _read(self) -> Optional[ButtonType]:
+    def _read(self, max_age_ms: Optional[float] = None) -> Optional[ButtonType]:
         try:
-            data = self._characteristic.read_value()
+            data = self._state.read(StateCache.BUTTON, self._characteristic, max_age_ms)
 
             if not data:
                 return None
@@ -110,18 +162,30 @@ class ButtonCharacteristic:
             parsed_data = self._spec.parse(Buffer(data))
             return parsed_data
         except Exception as e:
-            print(e)
+            logger.warning("failed to read button: %s", e)
             return None
 
 
 class ConfigurationCharacteristic:
     UUID = UUID("10b201ff5b3b45719508cf3efcd7bbae")
+    REQUEST_TIMEOUT_MS = 3000
+    RETRY_INTERVAL_MS = 200
 
-    def __init__(self, characteristic: GattCharacteristic):
+    def __init__(
+        self,
+        characteristic: GattCharacteristic,
+        writer: Optional[CharacteristicWriter] = None,
+        metrics: Optional[CubeMetrics] = None,
+    ):
         self._characteristic: GattCharacteristic = characteristic
-        self._characteristic.start_notify(self._on_data)
+        self._writer = writer or CharacteristicWriter(characteristic)
         self._ble_protocol_version: Optional[str] = None
         self._event_emitter: ToioEventEmitter = ToioEventEmitter()
+        self._metrics = metrics or CubeMetrics()
+        self.subscribe()
+
+    def subscribe(self):
+        self._characteristic.start_notify(self._on_data)
 
     def init(self, ble_protocol_version: str):
         self._ble_protocol_version = ble_protocol_version
@@ -130,22 +194,35 @@ class ConfigurationCharacteristic:
         self._ble_protocol_version = version
         self._event_emitter.put(version)
 
-    def get_ble_protocol_version(self):
+    def get_ble_protocol_version(self, timeout_ms: int = REQUEST_TIMEOUT_MS):
         if self._ble_protocol_version:
             return self._ble_protocol_version
-        else:
-            byte_data = Buffer.from_data([0x01, 0x00]).byte_data
-            self._characteristic.write_value(byte_data)
-            self._event_emitter.once(
-                "configuration:ble-protocol-version", self.once_data
-            )
-            return_value = self._event_emitter.get()
-            return return_value
+
+        # 応答を取りこぼさないよう書き込み前にlistenerを登録する
+        self._event_emitter.once("configuration:ble-protocol-version", self.once_data)
+        byte_data = Buffer.from_data([0x01, 0x00]).byte_data
+        deadline = time.monotonic() + timeout_ms / 1000
+
+        # notifyの購読完了は通知されないため、応答が来るまで要求を再送する
+        while True:
+            self._writer.write(byte_data)
+            remaining = deadline - time.monotonic()
+            try:
+                version = self._event_emitter.get(
+                    timeout=max(min(remaining, self.RETRY_INTERVAL_MS / 1000), 0)
+                )
+            except Empty:
+                version = None
+            if version:
+                return version
+            if time.monotonic() >= deadline:
+                self._event_emitter.remove_listener(
+                    "configuration:ble-protocol-version", self.once_data
+                )
+                raise ToioException("Exceeded timeout waiting for ble protocol version")
 
     def set_collision_threshold(self, threshold: int):
-        self._characteristic.write_value(
-            Buffer.from_data([0x06, 0x00, threshold]).byte_data
-        )
+        self._writer.write(Buffer.from_data([0x06, 0x00, threshold]).byte_data)
 
     def _data2result(self, data: Buffer):
         type_data = data.read_uint8(0)
@@ -156,222 +233,441 @@ class ConfigurationCharacteristic:
             self._event_emitter.put(None)
 
     def _on_data(self, data):
-        buffer = Buffer.from_data(data)
-        self._data2result(buffer)
+        self._metrics.increment(CubeMetrics.NOTIFICATIONS)
+        try:
+            buffer = Buffer.from_data(data)
+            self._data2result(buffer)
+        except Exception as e:
+            self._metrics.increment(CubeMetrics.PARSE_ERRORS)
+            logger.warning("failed to handle configuration notification: %s", e)
 
 
 class IdCharacteristic:
     UUID = UUID("10b201015b3b45719508cf3efcd7bbae")
+    EVENT_TYPES = {
+        0x01: "id:position-id",
+        0x02: "id:standard-id",
+        0x03: "id:position-id-missed",
+        0x04: "id:standard-id-missed",
+    }
 
     def __init__(
-        self, characteristic: GattCharacteristic, eventEmitter: ToioEventEmitter
+        self,
+        characteristic: GattCharacteristic,
+        eventEmitter: ToioEventEmitter,
+        fast_position_id: bool = False,
+        position_buffer: Optional[PositionRingBuffer] = None,
+        metrics: Optional[CubeMetrics] = None,
     ):
         self._characteristic: GattCharacteristic = characteristic
-        self._characteristic.start_notify(self._on_data)
         self._event_emitter = eventEmitter
+        self._spec: IdSpec = IdSpec()
+        self._fast_position_id = fast_position_id
+        self._position_buffer = position_buffer
+        self._metrics = metrics or CubeMetrics()
+        self.subscribe()
+
+    def subscribe(self):
+        self._characteristic.start_notify(self._on_data)
 
     def _on_data(self, data):
-        buffer = Buffer.from_data(data)
-        id_spec: IdSpec = IdSpec()
+        self._metrics.increment(CubeMetrics.NOTIFICATIONS)
+        if not data:
+            return
+
+        event = IdCharacteristic.EVENT_TYPES.get(data[0])
+        emit = event is None or self._event_emitter.accepts(event)
+        # 購読されていない通知は、位置の記録に必要な場合を除いて解析しない
+        if not emit and (
+            self._position_buffer is None
+            or event not in ("id:position-id", "id:position-id-missed")
+        ):
+            return
 
         try:
-            ret: Union[PositionIdType, StandardIdType, IdMissedType] = id_spec.parse(
+            if self._fast_position_id:
+                # Buffer/IdSpec/PositionIdInfoを経由せずPositionIdRecordを直接作る
+                if not isinstance(data, (bytes, bytearray)):
+                    data = bytes(data)
+                if len(data) >= codecs.POSITION_ID.size and data[0] == 1:
+                    record = PositionIdRecord._make(
+                        codecs.POSITION_ID_FIELDS.unpack_from(data, 1)
+                    )
+                    if self._position_buffer is not None:
+                        self._position_buffer.record(*record)
+                    if emit:
+                        self._event_emitter.emit("id:position-id", record)
+                    return
+
+            buffer = Buffer.from_data(data)
+            ret: Union[PositionIdType, StandardIdType, IdMissedType] = self._spec.parse(
                 buffer
             )
 
             if ret.data_type == "id:position-id":
-                self._event_emitter.emit(ret.data_type, ret.data)
+                if self._position_buffer is not None:
+                    info = ret.data
+                    self._position_buffer.record(
+                        info.x, info.y, info.angle, info.sensor_x, info.sensor_y
+                    )
+                if emit:
+                    self._event_emitter.emit(ret.data_type, ret.data)
             elif ret.data_type == "id:standard-id":
                 self._event_emitter.emit(ret.data_type, ret.data)
             elif (
                 ret.data_type == "id:position-id-missed"
                 or ret.data_type == "id:standard-id-missed"
             ):
-                self._event_emitter.emit(ret.data_type)
+                if (
+                    ret.data_type == "id:position-id-missed"
+                    and self._position_buffer is not None
+                ):
+                    self._position_buffer.record_missed()
+                if emit:
+                    self._event_emitter.emit(ret.data_type)
         except Exception as e:
-            print(e)
+            self._metrics.increment(CubeMetrics.PARSE_ERRORS)
+            logger.warning("failed to handle id notification: %s", e)
 
 
 class LightCharacteristic:
     UUID = UUID("10b201035b3b45719508cf3efcd7bbae")
 
-    def __init__(self, characteristic: GattCharacteristic):
+    def __init__(
+        self,
+        characteristic: GattCharacteristic,
+        writer: Optional[CharacteristicWriter] = None,
+    ):
         self._characteristic: GattCharacteristic = characteristic
+        self._writer = writer or CharacteristicWriter(characteristic)
         self._spec: LightSpec = LightSpec()
-        self._timer = None
+        self._pending: Optional[TimeoutFuture] = None
 
-    def turn_on_light(self, operation: LightOperation):
+    def turn_on_light(
+        self, operation: LightOperation, without_response: Optional[bool] = None
+    ) -> TimeoutFuture:
+        data: TurnOnLightType = self._spec.turn_on_light(operation)
+        return self.write_turn_on_light(data, without_response)
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+    def write_turn_on_light(
+        self, data: TurnOnLightType, without_response: Optional[bool] = None
+    ) -> TimeoutFuture:
 
-        data: TurnOnLightType = self._spec.turn_on_light(operation)
-        self._characteristic.write_value(data.buffer.byte_data)
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
+
+        self._writer.write(data.buffer.byte_data, "turn_on_light", without_response)
 
-        if data is not None and data.data is not None and data.data.duration_ms > 0:
-            self._timer = set_timeout(lambda: None, data.data.duration_ms)
+        # 点灯時間0は消灯か次のコマンドまで点灯し続ける
+        duration_ms = data.data.duration_ms
+        self._pending = TimeoutFuture(duration_ms if duration_ms > 0 else None)
+        return self._pending
 
     def turn_on_light_with_scenario(
-        self, operations: List[LightOperation], repeat_count: int = 0
-    ):
+        self,
+        operations: Union[List[LightOperation], LightScenario],
+        repeat_count: int = 0,
+    ) -> TimeoutFuture:
+        # コンパイル済みのシナリオはそのまま送り、それ以外はキャッシュを通す
+        if isinstance(operations, LightScenario):
+            return self.write_scenario(operations)
+        return self.write_scenario(LightScenario.cached(operations, repeat_count))
 
-        if not operations:
-            raise ToioException("invalid argument: empty operation")
+    def write_scenario(self, scenario: LightScenario) -> TimeoutFuture:
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
 
-        data: TurnOnLightWithScenarioType = self._spec.turn_on_light_with_scenario(
-            operations, repeat_count
-        )
-        self._characteristic.write_value(data.buffer.byte_data)
+        self._writer.write(scenario.payload)
 
-        if (
-            data is not None
-            and data.data is not None
-            and data.data.total_duration_ms > 0
-        ):
-            self._timer = set_timeout(lambda: None, data.data.total_duration_ms)
+        self._pending = TimeoutFuture(
+            None if scenario.repeats_forever else scenario.total_duration_ms
+        )
+        return self._pending
 
     def turn_off_light(self):
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
 
         data: TurnOffLightType = self._spec.turn_off_light()
-        self._characteristic.write_value(data.buffer.byte_data)
+        self._writer.write(data.buffer.byte_data)
+
+
+class MoveToFuture(Future):
+    # 最後の目標の応答コードで完了する。途中で失敗した場合はその応答コードで完了する
+    # 書き込みで例外が起きた場合はその例外で完了する
+    REASON_SUCCESS = 0x00
+    REASON_OVERWRITTEN = 0x05
+
+    def __init__(
+        self,
+        write: Callable[[MoveToType], None],
+        spec: MotorSpec,
+        event_emitter: ToioEventEmitter,
+        targets: List[MoveToTarget],
+        options: MoveToOptions,
+        pipeline_depth: int,
+    ):
+        super(MoveToFuture, self).__init__()
+        self._write = write
+        self._spec = spec
+        self._event_emitter = event_emitter
+        self._options = options
+        self._pipeline_depth = max(pipeline_depth, 1)
+        size = MotorSpec.NUMBER_OF_TARGETS_PER_OPERATION
+        self._chunks = [targets[i : i + size] for i in range(0, len(targets), size)]
+        self._next_chunk = 0
+        self._in_flight: List[int] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._event_emitter.on("motor:response", self._on_response)
+        self._send_chunks()
+
+    def replace(self):
+        self._finish(MoveToFuture.REASON_OVERWRITTEN)
+
+    def _send_chunks(self):
+        # 応答を待たずに追加書き込みで次の目標群をキューブに積んでおく
+        while True:
+            with self._lock:
+                if (
+                    self.done()
+                    or self._next_chunk >= len(self._chunks)
+                    or len(self._in_flight) >= self._pipeline_depth
+                ):
+                    return
+                options = MoveToOptions(
+                    self._options.move_type,
+                    self._options.max_speed,
+                    self._options.speed_type,
+                    self._options.timeout,
+                    self._options.overwrite if self._next_chunk == 0 else False,
+                )
+                data: MoveToType = self._spec.move_to(
+                    self._chunks[self._next_chunk], options
+                )
+                self._in_flight.append(data.data.options.operation_id)
+                self._next_chunk += 1
+            try:
+                self._write(data)
+            except Exception as e:
+                logger.warning("failed to write move_to targets: %s", e)
+                self._fail(e)
+                return
+
+    def _on_response(self, response: MotorResponseData):
+        with self._lock:
+            if response.operation_id not in self._in_flight:
+                return
+            self._in_flight.remove(response.operation_id)
+            completed = not self._in_flight and self._next_chunk >= len(self._chunks)
+
+        if response.reason != MoveToFuture.REASON_SUCCESS or completed:
+            self._finish(response.reason)
+        else:
+            # notifyのコールバック内では書き込まない
+            call_later(self._send_chunks)
+
+    def _finish(self, reason: int):
+        with self._lock:
+            if self.done():
+                return
+            self.set_result(reason)
+        self._event_emitter.remove_listener("motor:response", self._on_response)
+
+    def _fail(self, error: Exception):
+        with self._lock:
+            if self.done():
+                return
+            self.set_exception(error)
+        self._event_emitter.remove_listener("motor:response", self._on_response)
 
 
 class MotorCharacteristic:
     UUID = UUID("10b201025b3b45719508cf3efcd7bbae")
+    # move_toに対応するBLEプロトコルのバージョン
+    MOVE_TO_VERSION = (2, 1, 0)
+    MOVE_TO_PIPELINE_DEPTH = 2
 
-    def __init__(self, characteristic: GattCharacteristic):
+    def __init__(
+        self,
+        characteristic: GattCharacteristic,
+        eventEmitter: ToioEventEmitter,
+        writer: Optional[CharacteristicWriter] = None,
+        metrics: Optional[CubeMetrics] = None,
+    ):
         self._characteristic: GattCharacteristic = characteristic
+        self._writer = writer or CharacteristicWriter(characteristic)
         self._spec = MotorSpec()
-        self._characteristic.start_notify(self._on_data)
-        self._event_emitter = ToioEventEmitter()
+        self._event_emitter: ToioEventEmitter = eventEmitter
+        self._metrics = metrics or CubeMetrics()
         self._ble_protocol_version: Optional[str] = None
-        self._timer = None
+        # operation_idごとの書き込み時刻。応答までの遅延の計測に使う
+        self._write_times: Dict[int, float] = {}
+        self._pending: Optional[Union[TimeoutFuture, MoveToFuture]] = None
+        self.subscribe()
+
+    def subscribe(self):
+        self._characteristic.start_notify(self._on_data)
 
     def init(self, ble_protocol_version: str):
         self._ble_protocol_version = ble_protocol_version
 
-    def move(self, left: int, right: int, duration_ms: int):
-
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
-
+    def move(
+        self,
+        left: int,
+        right: int,
+        duration_ms: int,
+        without_response: Optional[bool] = None,
+    ) -> TimeoutFuture:
         data: MoveType = self._spec.move(left, right, duration_ms)
-        self._characteristic.write_value(data.buffer.byte_data)
+        return self.write_move(data, without_response)
 
-        if data is not None and data.data is not None and data.data.duration_ms > 0:
-            self._timer = set_timeout(lambda: None, duration_ms)
+    def write_move(
+        self, data: MoveType, without_response: Optional[bool] = None
+    ) -> TimeoutFuture:
 
-    def move_to(self, targets: List[MoveToTarget], options: MoveToOptions):
-        print("not implemented")
-        pass
-        """
-        if self._ble_protocol_version != '2.1.0':
-            print("ble protocol version is old")
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+        # 連続したmoveは未送信のものを最新の値で置き換える
+        self._writer.write(data.buffer.byte_data, "move", without_response)
 
-        def create_handler(targets, options):
+        # 時間0のmoveは次のコマンドまで動き続ける。停止はすぐに完了とする
+        stopped = data.data.left == 0 and data.data.right == 0
+        duration_ms = data.data.duration_ms
+        self._pending = TimeoutFuture(
+            duration_ms if duration_ms > 0 or stopped else None
+        )
+        return self._pending
+
+    def move_to(
+        self,
+        targets: List[MoveToTarget],
+        options: MoveToOptions,
+        pipeline_depth: int = MOVE_TO_PIPELINE_DEPTH,
+    ) -> MoveToFuture:
+
+        if not targets:
+            raise ToioException("invalid argument: empty targets")
+
+        version = self._ble_protocol_version
+        if version and parse_version(version) < MotorCharacteristic.MOVE_TO_VERSION:
+            logger.warning(
+                "move_to requires ble protocol version 2.1.0 or later: %s",
+                version,
+            )
 
-            data = self._spec.move_to(targets, options)
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
+
+        future = MoveToFuture(
+            self._write_move_to,
+            self._spec,
+            self._event_emitter,
+            targets,
+            options,
+            pipeline_depth,
+        )
+        self._pending = future
+        future.start()
+        if future.done() and future.exception() is not None:
+            self._pending = None
+        return future
 
-            def handle_response(operation_id, reason):
-                if operation_id == data.data.options.operation_id:
-                    self._event_emitter.remove_listener(
-                        'motor:response', handle_response
-                    )
-                if reason != 0 and reason != 5:
-                    print("error")
-            self._characteristic.write_value(data.buffer.byte_data)
-            self._event_emitter.on('motor:response', handle_response)
-        """
+    def stop(self) -> TimeoutFuture:
+        return self.move(0, 0, 0)
 
-    def stop(self):
-        self.move(0, 0, 0)
+    def _write_move_to(self, data: MoveToType):
+        self._write_times[data.data.options.operation_id] = time.perf_counter()
+        self._writer.write(data.buffer.byte_data)
 
     def _on_data(self, data):
+        self._metrics.increment(CubeMetrics.NOTIFICATIONS)
         try:
+            received = time.perf_counter()
             buffer = Buffer.from_data(data)
             ret: MotorResponse = self._spec.parse(buffer)
-            self._event_emitter.emit(
-                "motor:response", ret.data.operationId, ret.data.reason
-            )
+            written = self._write_times.pop(ret.data.operation_id, None)
+            if written is not None:
+                ret.data.latency_ms = (received - written) * 1000
+                self._metrics.record_timing("motor.response", ret.data.latency_ms)
+            self._event_emitter.emit("motor:response", ret.data)
         except Exception as e:
-            print(e)
+            self._metrics.increment(CubeMetrics.PARSE_ERRORS)
+            logger.warning("failed to handle motor notification: %s", e)
 
 
 class SensorCharacteristic:
     UUID = UUID("10b201065b3b45719508cf3efcd7bbae")
+    EVENTS = (
+        "sensor:slope",
+        "sensor:collision",
+        "sensor:double-tap",
+        "sensor:orientation",
+    )
+    # 前回の通知から値が変わったときだけ発行するイベント
+    CHANGE_EVENTS = ("sensor:slope", "sensor:orientation")
 
     def __init__(
-        self, characteristic: GattCharacteristic, eventEmitter: ToioEventEmitter
+        self,
+        characteristic: GattCharacteristic,
+        eventEmitter: ToioEventEmitter,
+        metrics: Optional[CubeMetrics] = None,
+        state: Optional[StateCache] = None,
     ):
         self._characteristic: GattCharacteristic = characteristic
         self._spec: SensorSpec = SensorSpec()
-        self._characteristic.start_notify(self._on_data)
         self._event_emitter: ToioEventEmitter = eventEmitter
+        self._metrics = metrics or CubeMetrics()
+        self._state = state or StateCache(None)
         self._prev_status: SensorTypeData = SensorTypeData()
+        # listenerがいない間に受け取った最後の生データ。変化の判定に使う時だけ解析する
+        self._prev_data: Optional[bytes] = None
+        self.subscribe()
+
+    def subscribe(self):
+        self._characteristic.start_notify(self._on_data)
 
-    def get_slope_status(self) -> Optional[SensorTypeData]:
-        parsedData: Optional[SensorType] = self._read()
+    def get_sensor_snapshot(self, max_age_ms: Optional[float] = None) -> SensorTypeData:
+        # 1回の読み出しで全ての値を返す。個別のgetterもこれを使う
+        parsedData: Optional[SensorType] = self._read(max_age_ms)
         if parsedData is not None and parsedData.data is not None:
-            return (
-                SensorTypeData(is_sloped=parsedData.data.is_sloped)
-                if parsedData is not None
-                else None
-            )
+            return parsedData.data
         else:
             raise ToioException("cannot read any data from characteristic")
 
+    def get_slope_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[SensorTypeData]:
+        snapshot = self.get_sensor_snapshot(max_age_ms)
+        return SensorTypeData(is_sloped=snapshot.is_sloped)
+
+    # 衝突とダブルタップは一瞬だけ立つ値のため、キャッシュを使わず常に読み出す
     def get_collision_status(self) -> Optional[SensorTypeData]:
-        parsedData: Optional[SensorType] = self._read()
-        if parsedData is not None and parsedData.data is not None:
-            return (
-                SensorTypeData(
-                    is_collision_detected=parsedData.data.is_collision_detected
-                )
-                if parsedData is not None
-                else None
-            )
-        else:
-            raise ToioException("cannot read any data from characteristic")
+        snapshot = self.get_sensor_snapshot(0)
+        return SensorTypeData(is_collision_detected=snapshot.is_collision_detected)
 
     def get_double_tap_status(self) -> Optional[SensorTypeData]:
-        parsedData: Optional[SensorType] = self._read()
-        if parsedData is not None and parsedData.data is not None:
-            return (
-                SensorTypeData(is_double_tapped=parsedData.data.is_double_tapped)
-                if parsedData is not None
-                else None
-            )
-        else:
-            raise ToioException("cannot read any data from characteristic")
+        snapshot = self.get_sensor_snapshot(0)
+        return SensorTypeData(is_double_tapped=snapshot.is_double_tapped)
 
-    def get_orientation(self) -> Optional[SensorTypeData]:
-        parsedData: Optional[SensorType] = self._read()
-        if parsedData is not None and parsedData.data is not None:
-            return (
-                SensorTypeData(orientation=parsedData.data.orientation)
-                if parsedData is not None
-                else None
-            )
-        else:
-            raise ToioException("cannot read any data from characteristic")
+    def get_orientation(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[SensorTypeData]:
+        snapshot = self.get_sensor_snapshot(max_age_ms)
+        return SensorTypeData(orientation=snapshot.orientation)
 
-    def _read(self) -> Optional[SensorType]:
+    def _read(self, max_age_ms: Optional[float] = None) -> Optional[SensorType]:
         try:
-            data = self._characteristic.read_value()
+            data = self._state.read(StateCache.SENSOR, self._characteristic, max_age_ms)
 
             if not data:
                 raise ToioException("cannot read any data from characteristic")
@@ -379,81 +675,113 @@ class SensorCharacteristic:
             parsed_data: SensorType = self._spec.parse(Buffer(data))
             return parsed_data
         except Exception as e:
-            print(e)
+            logger.warning("failed to read sensor: %s", e)
             return None
 
     def _on_data(self, data):
+        self._metrics.increment(CubeMetrics.NOTIFICATIONS)
+        # モーションセンサー以外の情報でキャッシュを上書きしない
+        if data and data[0] == 0x01:
+            self._state.update(StateCache.SENSOR, data)
+        emitter = self._event_emitter
+        if not any(emitter.has_listeners(e) for e in SensorCharacteristic.EVENTS):
+            self._prev_data = bytes(data)
+            return
+
         try:
+            if self._prev_data is not None:
+                prev_data, self._prev_data = self._prev_data, None
+                self._prev_status = self._spec.parse(Buffer.from_data(prev_data)).data
             buffer = Buffer.from_data(data)
             parsed_data: SensorType = self._spec.parse(buffer)
 
             if self._prev_status.is_sloped != parsed_data.data.is_sloped:
-                self._event_emitter.emit(
-                    "sensor:slope", SensorTypeData(is_sloped=parsed_data.data.is_sloped)
-                )
+                if emitter.accepts("sensor:slope"):
+                    emitter.emit(
+                        "sensor:slope",
+                        SensorTypeData(is_sloped=parsed_data.data.is_sloped),
+                    )
             if parsed_data.data.is_collision_detected:
-                self._event_emitter.emit(
-                    "sensor:collision",
-                    SensorTypeData(
-                        is_collision_detected=parsed_data.data.is_collision_detected
-                    ),
-                )
+                if emitter.accepts("sensor:collision"):
+                    emitter.emit(
+                        "sensor:collision",
+                        SensorTypeData(
+                            is_collision_detected=parsed_data.data.is_collision_detected
+                        ),
+                    )
             if parsed_data.data.is_double_tapped:
-                self._event_emitter.emit(
-                    "sensor:double-tap",
-                    SensorTypeData(is_double_tapped=parsed_data.data.is_double_tapped),
-                )
+                if emitter.accepts("sensor:double-tap"):
+                    emitter.emit(
+                        "sensor:double-tap",
+                        SensorTypeData(
+                            is_double_tapped=parsed_data.data.is_double_tapped
+                        ),
+                    )
             if self._prev_status.orientation != parsed_data.data.orientation:
-                self._event_emitter.emit(
-                    "sensor:orientation",
-                    SensorTypeData(orientation=parsed_data.data.orientation),
-                )
+                if emitter.accepts("sensor:orientation"):
+                    emitter.emit(
+                        "sensor:orientation",
+                        SensorTypeData(orientation=parsed_data.data.orientation),
+                    )
             self._prev_status = parsed_data.data
         except Exception as e:
-            print(e)
+            self._metrics.increment(CubeMetrics.PARSE_ERRORS)
+            logger.warning("failed to handle sensor notification: %s", e)
 
 
 class SoundCharacteristic:
     UUID = UUID("10b201045b3b45719508cf3efcd7bbae")
 
-    def __init__(self, characteristic: GattCharacteristic):
+    def __init__(
+        self,
+        characteristic: GattCharacteristic,
+        writer: Optional[CharacteristicWriter] = None,
+    ):
         self._characteristic: GattCharacteristic = characteristic
+        self._writer = writer or CharacteristicWriter(characteristic)
         self._spec: SoundSpec = SoundSpec()
-        self._timer = None
+        self._pending: Optional[TimeoutFuture] = None
 
-    def play_preset_sound(self, sound_id: int):
+    def play_preset_sound(self, sound_id: int) -> TimeoutFuture:
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
 
         data: PlayPresetSoundType = self._spec.play_preset_sound(sound_id)
-        self._characteristic.write_value(data.buffer.byte_data)
+        self._writer.write(data.buffer.byte_data)
 
-        if data is not None and data.data is not None and data.data.duration_ms > 0:
-            self._timer = set_timeout(lambda: None, data.data.duration_ms)
+        # プリセット音の長さは取得できないため即時に完了とする
+        self._pending = TimeoutFuture()
+        return self._pending
 
-    def play_sound(self, operations: List[SoundOperation], repeat_count: int = 0):
+    def play_sound(
+        self,
+        operations: Union[List[SoundOperation], SoundScenario],
+        repeat_count: int = 0,
+    ) -> TimeoutFuture:
+        if isinstance(operations, SoundScenario):
+            return self.write_scenario(operations)
+        return self.write_scenario(SoundScenario.cached(operations, repeat_count))
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+    def write_scenario(self, scenario: SoundScenario) -> TimeoutFuture:
 
-        data: PlaySoundType = self._spec.play_sound(operations, repeat_count)
-        self._characteristic.write_value(data.buffer.byte_data)
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
 
-        if (
-            data is not None
-            and data.data is not None
-            and data.data.total_duration_ms > 0
-        ):
-            self._timer = set_timeout(lambda: None, data.data.total_duration_ms)
+        self._writer.write(scenario.payload)
+
+        self._pending = TimeoutFuture(
+            None if scenario.repeats_forever else scenario.total_duration_ms
+        )
+        return self._pending
 
     def stop_sound(self):
 
-        if self._timer:
-            clear_timeout(self._timer)
-            self._timer = None
+        if self._pending:
+            self._pending.replace()
+            self._pending = None
 
         data: StopSoundType = self._spec.stop_sound()
-        self._characteristic.write_value(data.buffer.byte_data)
+        self._writer.write(data.buffer.byte_data)
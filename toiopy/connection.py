@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from toiopy.cube import Cube
+from toiopy.data import ToioEventEmitter
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionManager:
+    # Cube.idごとにキューブを保持し、切断を検知したらスキャンせずに再接続する
+    # 再接続に失敗した場合は間隔を倍にしながら再試行する
+    # イベント
+    #   connection:lost (cube)
+    #   connection:restored (cube)
+    #   connection:failed (cube, attempts)
+    POLL_INTERVAL_MS = 1000
+    INITIAL_BACKOFF_MS = 500
+    MAX_BACKOFF_MS = 30000
+
+    def __init__(
+        self,
+        cubes: Optional[List[Cube]] = None,
+        poll_interval_ms: int = POLL_INTERVAL_MS,
+        initial_backoff_ms: int = INITIAL_BACKOFF_MS,
+        max_backoff_ms: int = MAX_BACKOFF_MS,
+        connect_timeout_ms: int = Cube.CONNECT_TIMEOUT_MS,
+        max_concurrency: int = 4,
+    ):
+        self._poll_interval_ms = poll_interval_ms
+        self._initial_backoff_ms = initial_backoff_ms
+        self._max_backoff_ms = max_backoff_ms
+        self._connect_timeout_ms = connect_timeout_ms
+        self._max_concurrency = max_concurrency
+        self._event_emitter = ToioEventEmitter()
+
+        self._cubes: Dict[object, Cube] = {}
+        self._attempts: Dict[object, int] = {}
+        self._next_attempt: Dict[object, float] = {}
+        self._reconnecting: Set[object] = set()
+        self._stats: Dict[object, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        for cube in cubes or []:
+            self.add(cube)
+
+    @property
+    def cubes(self) -> List[Cube]:
+        with self._lock:
+            return list(self._cubes.values())
+
+    @property
+    def stats(self) -> Dict[object, Dict[str, float]]:
+        with self._lock:
+            return {cube_id: dict(stats) for cube_id, stats in self._stats.items()}
+
+    def __len__(self) -> int:
+        return len(self._cubes)
+
+    def __contains__(self, cube_id) -> bool:
+        return cube_id in self._cubes
+
+    def get(self, cube_id) -> Optional[Cube]:
+        return self._cubes.get(cube_id)
+
+    def add(self, cube: Cube):
+        with self._lock:
+            self._cubes[cube.id] = cube
+            self._attempts[cube.id] = 0
+            self._next_attempt.pop(cube.id, None)
+            self._stats.setdefault(
+                cube.id, {"disconnects": 0, "reconnects": 0, "failures": 0}
+            )
+
+    def remove(self, cube_id) -> Optional[Cube]:
+        with self._lock:
+            self._attempts.pop(cube_id, None)
+            self._next_attempt.pop(cube_id, None)
+            self._stats.pop(cube_id, None)
+            return self._cubes.pop(cube_id, None)
+
+    def on(self, event: str, listener):
+        self._event_emitter.on(event, listener)
+        return self
+
+    def off(self, event: str, listener):
+        self._event_emitter.remove_listener(event, listener)
+        return self
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _run(self):
+        while not self._stop.wait(self._poll_interval_ms / 1000):
+            self._poll()
+
+    def _poll(self):
+        now = time.monotonic()
+        lost: List[Cube] = []
+        due: List[Cube] = []
+        with self._lock:
+            for cube_id, cube in self._cubes.items():
+                # 明示的に切断されたキューブと再接続中のキューブは対象外
+                if (
+                    cube_id in self._reconnecting
+                    or cube.disconnect_requested
+                    or cube.is_connected
+                ):
+                    continue
+                if cube_id not in self._next_attempt:
+                    self._next_attempt[cube_id] = now
+                    self._stats[cube_id]["disconnects"] += 1
+                    self._stats[cube_id]["disconnected_at"] = time.time()
+                    lost.append(cube)
+                if self._next_attempt[cube_id] <= now:
+                    self._reconnecting.add(cube_id)
+                    due.append(cube)
+
+        # listenerからadd/removeを呼べるよう、ロックの外で通知する
+        for cube in lost:
+            self._event_emitter.emit("connection:lost", cube)
+        for cube in due:
+            if self._executor is not None:
+                self._executor.submit(self._reconnect, cube)
+
+    def _reconnect(self, cube: Cube):
+        started = time.monotonic()
+        try:
+            connected = cube.reconnect(self._connect_timeout_ms)
+        except Exception as e:
+            logger.warning("failed to reconnect to %s: %s", cube.id, e)
+            connected = False
+
+        with self._lock:
+            self._reconnecting.discard(cube.id)
+            if cube.id not in self._cubes:
+                return
+            stats = self._stats[cube.id]
+            if connected:
+                self._attempts[cube.id] = 0
+                self._next_attempt.pop(cube.id, None)
+                stats["reconnects"] += 1
+                stats["last_reconnect_ms"] = (time.monotonic() - started) * 1000
+            else:
+                attempts = self._attempts[cube.id] + 1
+                self._attempts[cube.id] = attempts
+                backoff_ms = min(
+                    self._initial_backoff_ms * 2 ** (attempts - 1), self._max_backoff_ms
+                )
+                self._next_attempt[cube.id] = time.monotonic() + backoff_ms / 1000
+                stats["failures"] += 1
+
+        if connected:
+            self._event_emitter.emit("connection:restored", cube)
+        else:
+            self._event_emitter.emit("connection:failed", cube, attempts)
@@ -1,14 +1,18 @@
+import logging
+import time
+from contextlib import contextmanager
 from uuid import UUID
-from typing import Optional, List
-
-from Adafruit_BluefruitLE.interfaces.device import Device
-from Adafruit_BluefruitLE.interfaces.gatt import GattService, GattCharacteristic
+from typing import Callable, Dict, Optional, List, Tuple, Union
 
 from toiopy.data import (
+    EventFilter,
     ToioException,
     ToioEventEmitter,
     MoveToOptions,
+    MoveToTarget,
+    MoveType,
     LightOperation,
+    TurnOnLightType,
     SoundOperation,
     ButtonTypeData,
     BatteryTypeData,
@@ -21,10 +25,21 @@ from toiopy.characteristics import (
     IdCharacteristic,
     LightCharacteristic,
     MotorCharacteristic,
+    MoveToFuture,
     SensorCharacteristic,
     SoundCharacteristic,
 )
-from toiopy.util import set_timeout
+from toiopy.dispatcher import Dispatcher
+from toiopy.metrics import CubeMetrics
+from toiopy.provider import Device, GattService, GattCharacteristic
+from toiopy.recorder import Recorder
+from toiopy.scenario import LightScenario, SoundScenario
+from toiopy.state import StateCache
+from toiopy.telemetry import PositionRingBuffer
+from toiopy.util import TimeoutFuture
+from toiopy.writer import CharacteristicWriter
+
+logger = logging.getLogger(__name__)
 
 
 class Cube:
@@ -43,11 +58,42 @@ class Cube:
         SoundCharacteristic.UUID,
     ]
 
+    # 通知の解析前にToioEventEmitter.acceptsで間引くイベント
+    _gated_events = frozenset(
+        BatteryCharacteristic.EVENTS
+        + ButtonCharacteristic.EVENTS
+        + tuple(IdCharacteristic.EVENT_TYPES.values())
+        + SensorCharacteristic.EVENTS
+    )
+    _change_events = frozenset(
+        ButtonCharacteristic.CHANGE_EVENTS + SensorCharacteristic.CHANGE_EVENTS
+    )
+
     _battery_characteristic: Optional[BatteryCharacteristic] = None
 
-    def __init__(self, peripheral: Device):
+    CONNECT_TIMEOUT_MS: int = 30000
+
+    def __init__(
+        self,
+        peripheral: Device,
+        fast_position_id: bool = False,
+        position_buffer_capacity: int = 0,
+        max_write_rate_hz: Optional[float] = None,
+        without_response: bool = False,
+        dispatcher: Optional[Dispatcher] = None,
+        state_max_age_ms: Optional[float] = None,
+        recorder: Optional[Recorder] = None,
+    ):
         self._peripheral: Device = peripheral
         self._event_emitter: ToioEventEmitter = ToioEventEmitter()
+        self._fast_position_id = fast_position_id
+        self._position_buffer: Optional[PositionRingBuffer] = (
+            PositionRingBuffer(position_buffer_capacity)
+            if position_buffer_capacity > 0
+            else None
+        )
+
+        self._id_characteristic: Optional[IdCharacteristic] = None
 
         self._motor_characteristic: Optional[MotorCharacteristic] = None
         self._light_characteristic: Optional[LightCharacteristic] = None
@@ -56,72 +102,271 @@ class Cube:
         self._button_characteristic: Optional[ButtonCharacteristic] = None
         self._battery_characteristic: Optional[BatteryCharacteristic] = None
         self._configuration_characteristic: Optional[ConfigurationCharacteristic] = None
+        self._connect_timings: Dict[str, float] = {}
+        # モーターとLEDの書き込みキュー。Noneの場合は呼び出し元で同期的に書き込む
+        self._max_write_rate_hz = max_write_rate_hz
+        # 応答なし書き込みの既定値。move/turn_on_lightの呼び出しごとに上書きできる
+        self._without_response = without_response
+        self._writers: Dict[str, CharacteristicWriter] = {}
+        # Cube.onで登録したlistenerと、実際にemitterへ登録したcallable
+        self._registered: Dict[Tuple[str, Callable], List[Callable]] = {}
+        # 指定された場合、listenerは通知スレッドではなくDispatcherのワーカーで実行する
+        self._dispatcher = dispatcher
+        # 再接続時に設定し直す値
+        self._collision_threshold: Optional[int] = None
+        self._disconnect_requested = False
+        self._metrics = CubeMetrics()
+        self._metrics.add_source("writers", lambda: self.write_stats)
+        # 電池、ボタン、センサーの最新値。state_max_age_msかgetterのmax_age_msを
+        # 指定した場合に限り、新しければ読み出さずにこれを返す
+        self._state = StateCache(state_max_age_ms)
+        self._metrics.add_source("state", lambda: self._state.stats)
+        # 指定された場合、全ての通知、書き込み、読み出しを記録する
+        self._recorder = recorder
 
     @property
     def id(self):
         return self._peripheral.id
 
-    def connect(self):
+    @property
+    def position_buffer(self) -> Optional[PositionRingBuffer]:
+        return self._position_buffer
+
+    @property
+    def is_connected(self) -> bool:
+        return self._peripheral.is_connected
+
+    @property
+    def state(self) -> StateCache:
+        return self._state
+
+    def connect(self, timeout_ms: int = CONNECT_TIMEOUT_MS):
+        self._connect_timings = {}
+        self._disconnect_requested = False
+        self._state.invalidate()
+        timeout_sec = timeout_ms / 1000
         try:
-            self._peripheral.connect()
-            self._peripheral.discover(self._services, self._characteristics)
-            service: GattService = self._peripheral.find_service(Cube.TOIO_SERVICE_ID)
+            with self._measure("connect"):
+                self._peripheral.connect(timeout_sec=timeout_sec)
+            with self._measure("discover"):
+                self._peripheral.discover(
+                    self._services, self._characteristics, timeout_sec=timeout_sec
+                )
+            service: Optional[GattService] = self._peripheral.find_service(
+                Cube.TOIO_SERVICE_ID
+            )
+            if service is None:
+                raise ToioException("Failed to find toio service")
             characteristics: List[GattCharacteristic] = service.list_characteristics()
             if characteristics:
-                self._set_characteristics(characteristics)
-
-            ble_protocol_version = self.get_ble_protocol_version()
-            print("ble_protocol_version:{0}\n".format(ble_protocol_version))
+                with self._measure("subscribe"):
+                    self._set_characteristics(characteristics)
+
+            # 最初の応答が返ることでnotifyの購読完了を確認する
+            with self._measure("protocol_version"):
+                ble_protocol_version = self.get_ble_protocol_version()
+            logger.debug(
+                "ble protocol version of %s: %s", self.id, ble_protocol_version
+            )
             self._init_characteristics(ble_protocol_version)
-            print("connected\n")
+            self._replay()
+            logger.info("connected to %s", self.id)
 
         except ToioException as e:
-            print(e)
+            logger.error("failed to connect to %s: %s", self.id, e)
+
+    @property
+    def connect_timings(self) -> Dict[str, float]:
+        return dict(self._connect_timings)
+
+    @property
+    def metrics(self) -> CubeMetrics:
+        return self._metrics
+
+    def get_metrics_snapshot(self) -> Dict:
+        return self._metrics.snapshot()
+
+    @property
+    def write_stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: writer.stats for name, writer in self._writers.items()}
+
+    @contextmanager
+    def _measure(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._connect_timings[phase] = elapsed_ms
+            self._metrics.record_timing("connect." + phase, elapsed_ms)
+
+    def reconnect(self, timeout_ms: int = CONNECT_TIMEOUT_MS) -> bool:
+        # 取得済みのcharacteristicを再利用し、discoverをやり直さずにnotifyだけ購読し直す
+        if self._configuration_characteristic is None:
+            self.connect(timeout_ms)
+            return self.is_connected
+
+        self._connect_timings = {}
+        self._disconnect_requested = False
+        # 切断中の変化は通知されていないため、以前の値は使わない
+        self._state.invalidate()
+        try:
+            with self._measure("connect"):
+                self._peripheral.connect(timeout_sec=timeout_ms / 1000)
+            # disconnectで閉じた書き込みキューを再び使えるようにする
+            for writer in self._writers.values():
+                writer.open()
+            with self._measure("subscribe"):
+                for characteristic in (
+                    self._id_characteristic,
+                    self._motor_characteristic,
+                    self._sensor_characteristic,
+                    self._button_characteristic,
+                    self._battery_characteristic,
+                    self._configuration_characteristic,
+                ):
+                    if characteristic is not None:
+                        characteristic.subscribe()
+            self._replay()
+        except Exception as e:
+            # handleが無効になっている場合はdiscoverからやり直す
+            logger.warning("failed to reconnect to %s, rediscovering: %s", self.id, e)
+            self.connect(timeout_ms)
+        return self.is_connected
+
+    @property
+    def disconnect_requested(self) -> bool:
+        return self._disconnect_requested
 
     def disconnect(self):
+        self._disconnect_requested = True
+        for writer in self._writers.values():
+            writer.close()
+        self._state.invalidate()
         if self._peripheral.is_connected:
             self._peripheral.disconnect()
-            print("disconnect")
-
-    def on(self, event: str, listener):
-        self._event_emitter.on(event, listener)
+            logger.info("disconnected from %s", self.id)
+
+    def on(
+        self,
+        event: str,
+        listener,
+        min_interval_ms: float = 0,
+        only_on_change: bool = False,
+        predicate: Optional[Callable[..., bool]] = None,
+    ):
+        # フィルタは通知スレッドで適用し、通過したものだけをDispatcherへ渡す
+        # 変化したときだけ発行されるイベントは、間引くと変化を取りこぼすため間隔を適用しない
+        if event in Cube._change_events:
+            min_interval_ms = 0
+        registered = listener
+        if self._dispatcher is not None:
+            registered = self._dispatcher.wrap(registered)
+        if min_interval_ms > 0 or only_on_change or predicate is not None:
+            registered = EventFilter(
+                registered, min_interval_ms, only_on_change, predicate
+            )
+        if registered is not listener:
+            self._registered.setdefault((event, listener), []).append(registered)
+        self._event_emitter.on(event, registered)
+        self._update_min_interval(event)
         return self
 
     def off(self, event: str, listener):
-        self._event_emitter.remove_listener(event, listener)
+        # 同じlistenerを複数回登録した場合は、それぞれのラッパーを全て外す
+        registered = self._registered.pop((event, listener), [])
+        if not registered or listener in self._event_emitter.listeners(event):
+            registered.append(listener)
+        for callback in registered:
+            self._event_emitter.remove_listener(event, callback)
+        self._update_min_interval(event)
         return self
 
+    def _update_min_interval(self, event: str):
+        # 全てのlistenerが間隔を指定している場合のみ、解析前に最短の間隔で間引く
+        # acceptsを呼ばないイベントでは、各EventFilterが自身の間隔で間引く
+        listeners = self._event_emitter.listeners(event)
+        min_interval_ms = min(
+            (
+                listener.min_interval_ms if isinstance(listener, EventFilter) else 0
+                for listener in listeners
+            ),
+            default=0,
+        )
+        if event not in Cube._gated_events:
+            min_interval_ms = 0
+        self._event_emitter.set_min_interval(event, min_interval_ms)
+        for listener in listeners:
+            if isinstance(listener, EventFilter):
+                listener.gated = 0 < listener.min_interval_ms <= min_interval_ms
+
     # ID Detection
 
     # Motor Control
-    def move(self, left: int, right: int, duration: int):
+    def move(
+        self,
+        left: int,
+        right: int,
+        duration: int,
+        without_response: Optional[bool] = None,
+    ) -> TimeoutFuture:
         if self._motor_characteristic:
-            self._motor_characteristic.move(left, right, duration)
+            return self._motor_characteristic.move(
+                left, right, duration, without_response
+            )
         else:
             raise ToioException("motor_characteristic is null")
 
-    def move_to(self, targets, options=MoveToOptions(0, 115, 0, 0, True)):
+    def write_move(
+        self, data: MoveType, without_response: Optional[bool] = None
+    ) -> TimeoutFuture:
+        # エンコード済みのペイロードをそのまま送る
         if self._motor_characteristic:
-            self._motor_characteristic.move_to(targets, options)
+            return self._motor_characteristic.write_move(data, without_response)
         else:
             raise ToioException("motor_characteristic is null")
 
-    def stop(self):
+    def move_to(
+        self,
+        targets: List[MoveToTarget],
+        options: MoveToOptions = MoveToOptions(0, 115, 0, 0, True),
+    ) -> MoveToFuture:
         if self._motor_characteristic:
-            self._motor_characteristic.stop()
+            return self._motor_characteristic.move_to(targets, options)
+        else:
+            raise ToioException("motor_characteristic is null")
+
+    def stop(self) -> TimeoutFuture:
+        if self._motor_characteristic:
+            return self._motor_characteristic.stop()
         else:
             raise ToioException("motor_characteristic is null")
 
     # LED
-    def turn_on_light(self, operation: LightOperation):
+    def turn_on_light(
+        self, operation: LightOperation, without_response: Optional[bool] = None
+    ) -> TimeoutFuture:
         if self._light_characteristic:
-            return self._light_characteristic.turn_on_light(operation)
+            return self._light_characteristic.turn_on_light(operation, without_response)
+        else:
+            raise ToioException("light_characteristic is null")
+
+    def write_turn_on_light(
+        self, data: TurnOnLightType, without_response: Optional[bool] = None
+    ) -> TimeoutFuture:
+        # エンコード済みのペイロードをそのまま送る
+        if self._light_characteristic:
+            return self._light_characteristic.write_turn_on_light(
+                data, without_response
+            )
         else:
             raise ToioException("light_characteristic is null")
 
     def turn_on_light_with_scenario(
-        self, operations: List[LightOperation], repeat_count: int = 0
-    ):
+        self,
+        operations: Union[List[LightOperation], LightScenario],
+        repeat_count: int = 0,
+    ) -> TimeoutFuture:
         if self._light_characteristic:
             return self._light_characteristic.turn_on_light_with_scenario(
                 operations, repeat_count
@@ -136,13 +381,17 @@ class Cube:
             raise ToioException("light_characteristic is null")
 
     # Sound
-    def play_preset_sound(self, sound_id: int):
+    def play_preset_sound(self, sound_id: int) -> TimeoutFuture:
         if self._sound_characteristic:
             return self._sound_characteristic.play_preset_sound(sound_id)
         else:
             raise ToioException("sound_characteristic is null")
 
-    def play_sound(self, operations: List[SoundOperation], repeat_count: int = 0):
+    def play_sound(
+        self,
+        operations: Union[List[SoundOperation], SoundScenario],
+        repeat_count: int = 0,
+    ) -> TimeoutFuture:
         if self._sound_characteristic:
             return self._sound_characteristic.play_sound(operations, repeat_count)
         else:
@@ -155,9 +404,17 @@ class Cube:
             raise ToioException("sound_characteristic is null")
 
     # Sensor
-    def get_slope_status(self) -> Optional[SensorTypeData]:
+    def get_sensor_snapshot(self, max_age_ms: Optional[float] = None) -> SensorTypeData:
+        if self._sensor_characteristic:
+            return self._sensor_characteristic.get_sensor_snapshot(max_age_ms)
+        else:
+            raise ToioException("sensor_characteristic is null")
+
+    def get_slope_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[SensorTypeData]:
         if self._sensor_characteristic:
-            return self._sensor_characteristic.get_slope_status()
+            return self._sensor_characteristic.get_slope_status(max_age_ms)
         else:
             raise ToioException("sensor_characteristic is null")
 
@@ -173,23 +430,29 @@ class Cube:
         else:
             raise ToioException("sensor_characteristic is null")
 
-    def get_orientation(self) -> Optional[SensorTypeData]:
+    def get_orientation(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[SensorTypeData]:
         if self._sensor_characteristic:
-            return self._sensor_characteristic.get_orientation()
+            return self._sensor_characteristic.get_orientation(max_age_ms)
         else:
             raise ToioException("sensor_characteristic is null")
 
     # button
-    def get_button_status(self) -> Optional[ButtonTypeData]:
+    def get_button_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[ButtonTypeData]:
         if self._button_characteristic:
-            return self._button_characteristic.get_button_status()
+            return self._button_characteristic.get_button_status(max_age_ms)
         else:
             raise ToioException("button_characteristic is null")
 
     # battery
-    def get_battery_status(self) -> Optional[BatteryTypeData]:
+    def get_battery_status(
+        self, max_age_ms: Optional[float] = None
+    ) -> Optional[BatteryTypeData]:
         if self._battery_characteristic:
-            return self._battery_characteristic.get_battery_status()
+            return self._battery_characteristic.get_battery_status(max_age_ms)
         else:
             raise ToioException("battery_characteristic is null")
 
@@ -203,53 +466,95 @@ class Cube:
     def set_collision_threshold(self, threshold: int):
         if self._configuration_characteristic:
             self._configuration_characteristic.set_collision_threshold(threshold)
+            self._collision_threshold = threshold
         else:
             raise ToioException("configuration_characteristic is null")
 
     def _set_characteristics(self, characteristics: List[GattCharacteristic]):
 
         for characteristic in characteristics:
+            if self._recorder is not None:
+                characteristic = self._recorder.wrap(self.id, characteristic)
+
             if IdCharacteristic.UUID == characteristic.uuid:
 
-                IdCharacteristic(characteristic, self._event_emitter)
+                self._id_characteristic = IdCharacteristic(
+                    characteristic,
+                    self._event_emitter,
+                    self._fast_position_id,
+                    self._position_buffer,
+                    self._metrics,
+                )
 
             elif MotorCharacteristic.UUID == characteristic.uuid:
-                characteristic._peripheral = self._peripheral
-                self._motor_characteristic = MotorCharacteristic(characteristic)
+                characteristic._peripheral = self._peripheral  # type: ignore
+                self._motor_characteristic = MotorCharacteristic(
+                    characteristic,
+                    self._event_emitter,
+                    self._create_writer("motor", characteristic),
+                    self._metrics,
+                )
 
             elif LightCharacteristic.UUID == characteristic.uuid:
 
-                self._light_characteristic = LightCharacteristic(characteristic)
+                self._light_characteristic = LightCharacteristic(
+                    characteristic, self._create_writer("light", characteristic)
+                )
 
             elif SoundCharacteristic.UUID == characteristic.uuid:
 
-                self._sound_characteristic = SoundCharacteristic(characteristic)
+                self._sound_characteristic = SoundCharacteristic(
+                    characteristic, self._create_writer("sound", characteristic, False)
+                )
 
             elif SensorCharacteristic.UUID == characteristic.uuid:
 
                 self._sensor_characteristic = SensorCharacteristic(
-                    characteristic, self._event_emitter
+                    characteristic, self._event_emitter, self._metrics, self._state
                 )
 
             elif ButtonCharacteristic.UUID == characteristic.uuid:
 
                 self._button_characteristic = ButtonCharacteristic(
-                    characteristic, self._event_emitter
+                    characteristic, self._event_emitter, self._metrics, self._state
                 )
 
             elif BatteryCharacteristic.UUID == characteristic.uuid:
 
                 self._battery_characteristic = BatteryCharacteristic(
-                    characteristic, self._event_emitter
+                    characteristic, self._event_emitter, self._metrics, self._state
                 )
 
             elif ConfigurationCharacteristic.UUID == characteristic.uuid:
 
                 self._configuration_characteristic = ConfigurationCharacteristic(
-                    characteristic
+                    characteristic,
+                    self._create_writer("configuration", characteristic, False),
+                    self._metrics,
                 )
-        set_timeout(lambda: None, 1000)
-        print("set characteristics")
+        logger.debug("set characteristics of %s", self.id)
+
+    def _create_writer(
+        self, name: str, characteristic: GattCharacteristic, queued: bool = True
+    ) -> CharacteristicWriter:
+        # キューと応答なし書き込みはモーターとLEDにのみ適用する
+        previous = self._writers.get(name)
+        if previous is not None:
+            previous.close()
+        writer = CharacteristicWriter(
+            characteristic,
+            self._max_write_rate_hz if queued else None,
+            without_response=self._without_response and queued,
+            metrics=self._metrics,
+        )
+        self._writers[name] = writer
+        return writer
+
+    def _replay(self):
+        if self._collision_threshold is not None and self._configuration_characteristic:
+            self._configuration_characteristic.set_collision_threshold(
+                self._collision_threshold
+            )
 
     def _init_characteristics(self, ble_protocol_version: str):
         if self._motor_characteristic:
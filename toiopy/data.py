@@ -1,9 +1,12 @@
-from typing import List, Any, Optional
-from struct import unpack_from, pack, pack_into
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+from struct import Struct
 from enum import Enum
 from pyee import BaseEventEmitter
 from queue import Queue
 
+from toiopy.characteristic import codecs
+
 
 class StandardId(Enum):
     CARD_TYPHOON = 3670016
@@ -68,38 +71,53 @@ Note = Enum(  # type: ignore
 
 
 class Buffer:
-    def __init__(self, byte_data: bytearray):
+    # バッファプロトコルを持つオブジェクト(bytes/bytearray/memoryview)をコピーせずに保持する
+    # from_dataに渡したbytearrayは共有されるため、保持する場合はcopy()すること
+    __slots__ = ("_byte_data", "bytelength")
+
+    def __init__(self, byte_data: Union[bytes, bytearray, memoryview]):
         self._byte_data = byte_data
         # 8bit符号なし整数（unsigned char）
         self.bytelength = len(byte_data)
 
     @property
-    def byte_data(self):
-        return bytearray(self._byte_data)
+    def byte_data(self) -> Union[bytes, bytearray, memoryview]:
+        # write_valueへコピーせずに渡せるよう元のオブジェクトを返す
+        return self._byte_data
+
+    def copy(self) -> "Buffer":
+        return Buffer(bytearray(self._byte_data))
+
+    @classmethod
+    def from_data(cls, data_array: Any) -> "Buffer":
+        if isinstance(data_array, (bytes, bytearray, memoryview)):
+            return cls(data_array)
+        return cls(bytearray(data_array))
 
     @classmethod
-    def from_data(cls, data_array: List):
-        size = len(data_array)
-        byte_data = pack("B" * size, *data_array)
-        return cls(bytearray(byte_data))
+    def pack(cls, codec: Struct, *values) -> "Buffer":
+        return cls(codec.pack(*values))
+
+    def unpack(self, codec: Struct, offset: int = 0) -> tuple:
+        return codec.unpack_from(self._byte_data, offset)
 
     def read_uint8(self, offset: int):
         # unpackした結果はtupleになっている
-        return unpack_from("B", self._byte_data, offset)[0]
+        return codecs.UINT8.unpack_from(self._byte_data, offset)[0]
 
     def read_uint16le(self, offset: int):
         # unpackした結果はtupleになっている
-        return unpack_from("<H", self._byte_data, offset)[0]
+        return codecs.UINT16LE.unpack_from(self._byte_data, offset)[0]
 
     def read_uint32le(self, offset: int):
         # unpackした結果はtupleになっている
-        return unpack_from("<I", self._byte_data, offset)[0]
+        return codecs.UINT32LE.unpack_from(self._byte_data, offset)[0]
 
     def write_uint8(self, value: int, offset: int):
-        return pack_into("B", self._byte_data, offset, value)
+        return codecs.UINT8.pack_into(self._byte_data, offset, value)
 
     def write_uint16le(self, value: int, offset: int):
-        return pack_into("<H", self._byte_data, offset, value)
+        return codecs.UINT16LE.pack_into(self._byte_data, offset, value)
 
     def to_str(
         self, encoding: str = "utf-8", start: int = 0, end: Optional[int] = None
@@ -108,7 +126,8 @@ class Buffer:
         if end is None:
             end = self.bytelength
 
-        return self._byte_data[start:end].decode(encoding)
+        # memoryviewのスライスはコピーを作らない
+        return str(memoryview(self._byte_data)[start:end], encoding)
 
     @classmethod
     def alloc(cls, size: int):
@@ -119,6 +138,58 @@ class ToioException(Exception):
     pass
 
 
+class EventFilter:
+    # Cube.onのオプションを適用してからlistenerを呼び出す
+    __slots__ = (
+        "listener",
+        "min_interval_ms",
+        "only_on_change",
+        "predicate",
+        "gated",
+        "_last_called",
+        "_last_values",
+    )
+
+    def __init__(
+        self,
+        listener: Callable,
+        min_interval_ms: float = 0,
+        only_on_change: bool = False,
+        predicate: Optional[Callable[..., bool]] = None,
+    ):
+        self.listener = listener
+        self.min_interval_ms = min_interval_ms
+        self.only_on_change = only_on_change
+        self.predicate = predicate
+        # ToioEventEmitter.acceptsで同じ間隔に間引かれている場合はTrueにする
+        self.gated = False
+        self._last_called = 0.0
+        self._last_values: Optional[tuple] = None
+
+    def __call__(self, *args):
+        if self.predicate is not None and not self.predicate(*args):
+            return
+        if self.only_on_change:
+            values = tuple(EventFilter._values(arg) for arg in args)
+            if values == self._last_values:
+                return
+            self._last_values = values
+        if self.min_interval_ms > 0 and not self.gated:
+            now = time.monotonic()
+            if (now - self._last_called) * 1000 < self.min_interval_ms:
+                return
+            self._last_called = now
+        self.listener(*args)
+
+    @staticmethod
+    def _values(data: Any):
+        # __slots__を持つデータクラスは__eq__を持たないため値で比較する
+        slots = getattr(type(data), "__slots__", None)
+        if slots and not isinstance(data, tuple):
+            return tuple(getattr(data, slot, None) for slot in slots)
+        return data
+
+
 class ToioEventEmitter(BaseEventEmitter):
 
     _TIMEOUT_SEC = 3
@@ -126,6 +197,31 @@ class ToioEventEmitter(BaseEventEmitter):
     def __init__(self):
         super(ToioEventEmitter, self).__init__()
         self._queue = Queue()
+        # イベントごとの最短の通知間隔と最後に通知した時刻
+        self._min_intervals: Dict[str, float] = {}
+        self._last_emitted: Dict[str, float] = {}
+
+    def set_min_interval(self, event: str, interval_ms: float):
+        if interval_ms > 0:
+            self._min_intervals[event] = interval_ms / 1000
+        else:
+            self._min_intervals.pop(event, None)
+
+    def has_listeners(self, event: str) -> bool:
+        # listeners()と異なりdefaultdictに空のエントリを作らない
+        return bool(self._events.get(event))
+
+    def accepts(self, event: str) -> bool:
+        # listenerがいない、または最短間隔に満たない通知は解析せずに捨ててよい
+        if not self.has_listeners(event):
+            return False
+        interval = self._min_intervals.get(event)
+        if interval is not None:
+            now = time.monotonic()
+            if now - self._last_emitted.get(event, 0.0) < interval:
+                return False
+            self._last_emitted[event] = now
+        return True
 
     def put(self, item, block=True, timeout=_TIMEOUT_SEC):
         self._queue.put(item, block, timeout)
@@ -135,6 +231,8 @@ class ToioEventEmitter(BaseEventEmitter):
 
 
 class DataType:
+    __slots__ = ("buffer", "data", "data_type")
+
     def __init__(self, buffer: Buffer, data: Any = None, data_type: str = ""):
         self.buffer = buffer
         self.data = data
@@ -142,17 +240,23 @@ class DataType:
 
 
 class BatteryTypeData:
+    __slots__ = ("level",)
+
     def __init__(self, level: int):
         self.level = level
 
 
 class ButtonTypeData:
+    __slots__ = ("id", "pressed")
+
     def __init__(self, id: int, pressed: bool):
         self.id = id
         self.pressed = pressed
 
 
 class PositionIdInfo:
+    __slots__ = ("x", "y", "angle", "sensor_x", "sensor_y")
+
     def __init__(self, x: int, y: int, angle: int, sensor_x: int, sensor_y: int):
         self.x = x
         self.y = y
@@ -161,13 +265,26 @@ class PositionIdInfo:
         self.sensor_y = sensor_y
 
 
+class PositionIdRecord(NamedTuple):
+    # PositionIdInfoと同じ属性名を持つ軽量な読み取り専用レコード
+    x: int
+    y: int
+    angle: int
+    sensor_x: int
+    sensor_y: int
+
+
 class StandardIdInfo:
+    __slots__ = ("standard_id", "angle")
+
     def __init__(self, standard_id: StandardId, angle: int):
         self.standard_id = standard_id
         self.angle = angle
 
 
 class LightOperation:
+    __slots__ = ("duration_ms", "red", "green", "blue")
+
     def __init__(self, duration_ms: int, red: int, green: int, blue: int):
         self.duration_ms = duration_ms
         self.red = red
@@ -176,6 +293,8 @@ class LightOperation:
 
 
 class TurnOnLightWithScenarioTypeData:
+    __slots__ = ("operations", "repeat_count", "total_duration_ms")
+
     def __init__(
         self,
         operations: List[LightOperation],
@@ -188,12 +307,19 @@ class TurnOnLightWithScenarioTypeData:
 
 
 class MotorResponseData:
-    def __init__(self, operation_id: int, reason: int):
+    __slots__ = ("operation_id", "reason", "latency_ms")
+
+    def __init__(
+        self, operation_id: int, reason: int, latency_ms: Optional[float] = None
+    ):
         self.operation_id = operation_id
         self.reason = reason
+        self.latency_ms = latency_ms
 
 
 class MoveTypeData:
+    __slots__ = ("left", "right", "duration_ms")
+
     def __init__(self, left: int, right: int, duration_ms: int):
         self.left = left
         self.right = right
@@ -201,6 +327,8 @@ class MoveTypeData:
 
 
 class MoveToTarget:
+    __slots__ = ("x", "y", "angle", "rotate_type")
+
     def __init__(
         self,
         x: Optional[int],
@@ -215,6 +343,15 @@ class MoveToTarget:
 
 
 class MoveToOptions:
+    __slots__ = (
+        "move_type",
+        "max_speed",
+        "speed_type",
+        "timeout",
+        "overwrite",
+        "operation_id",
+    )
+
     def __init__(
         self,
         move_type: int,
@@ -222,7 +359,7 @@ class MoveToOptions:
         speed_type: int,
         timeout: int,
         overwrite: bool,
-        operation_id: int = None,
+        operation_id: Optional[int] = None,
     ):
         self.move_type = move_type
         self.max_speed = max_speed
@@ -233,12 +370,21 @@ class MoveToOptions:
 
 
 class MoveToTypeData:
+    __slots__ = ("targets", "options")
+
     def __init__(self, targets: List[MoveToTarget], options: MoveToOptions):
         self.targets = targets
         self.options = options
 
 
 class SensorTypeData:
+    __slots__ = (
+        "is_sloped",
+        "is_collision_detected",
+        "is_double_tapped",
+        "orientation",
+    )
+
     def __init__(
         self,
         is_sloped: Optional[bool] = None,
@@ -253,17 +399,23 @@ class SensorTypeData:
 
 
 class SoundOperation:
+    __slots__ = ("duration_ms", "note_name")
+
     def __init__(self, duration_ms: int, note_name):
         self.duration_ms = duration_ms
         self.note_name = note_name
 
 
 class PlayPresetSoundTypeData:
+    __slots__ = ("sound_id",)
+
     def __init__(self, sound_id: int):
         self.sound_id = sound_id
 
 
 class PlaySoundTypeData:
+    __slots__ = ("operations", "repeat_count", "total_duration_ms")
+
     def __init__(
         self,
         operations: List[SoundOperation],
@@ -276,93 +428,105 @@ class PlaySoundTypeData:
 
 
 class BatteryType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: BatteryTypeData, data_type: str):
-        self.buffer = buffer
-        self.data = data
-        self.data_type = data_type
+        super(BatteryType, self).__init__(buffer, data, data_type)
 
 
 class ButtonType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: ButtonTypeData, data_type: str):
-        self.buffer = buffer
-        self.data = data
-        self.data_type = data_type
+        super(ButtonType, self).__init__(buffer, data, data_type)
 
 
 class PositionIdType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: PositionIdInfo, data_type: str):
-        self.buffer = buffer
-        self.data = data
-        self.data_type = data_type
+        super(PositionIdType, self).__init__(buffer, data, data_type)
 
 
 class StandardIdType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: StandardIdInfo, data_type: str):
-        self.buffer = buffer
-        self.data = data
-        self.data_type = data_type
+        super(StandardIdType, self).__init__(buffer, data, data_type)
 
 
 class IdMissedType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data_type: str):
-        self.buffer = buffer
-        self.data_type = data_type
+        super(IdMissedType, self).__init__(buffer, data_type=data_type)
 
 
 class TurnOnLightType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: LightOperation):
-        self.buffer = buffer
-        self.data = data
+        super(TurnOnLightType, self).__init__(buffer, data=data)
 
 
 class TurnOnLightWithScenarioType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: TurnOnLightWithScenarioTypeData):
-        self.buffer = buffer
-        self.data = data
+        super(TurnOnLightWithScenarioType, self).__init__(buffer, data=data)
 
 
 class TurnOffLightType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer):
-        self.buffer = buffer
+        super(TurnOffLightType, self).__init__(buffer)
 
 
 class MotorResponse(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: MotorResponseData):
-        self.buffer = buffer
-        self.data = data
+        super(MotorResponse, self).__init__(buffer, data=data)
 
 
 class MoveType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: MoveTypeData):
-        self.buffer = buffer
-        self.data = data
+        super(MoveType, self).__init__(buffer, data=data)
 
 
 class MoveToType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: MoveToTypeData):
-        self.buffer = buffer
-        self.data = data
+        super(MoveToType, self).__init__(buffer, data=data)
 
 
 class SensorType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: SensorTypeData, data_type: str):
-        self.buffer = buffer
-        self.data = data
-        self.data_type = data_type
+        super(SensorType, self).__init__(buffer, data, data_type)
 
 
 class PlayPresetSoundType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: PlayPresetSoundTypeData):
-        self.buffer = buffer
-        self.data = data
+        super(PlayPresetSoundType, self).__init__(buffer, data=data)
 
 
 class PlaySoundType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer, data: PlaySoundTypeData):
-        self.buffer = buffer
-        self.data = data
+        super(PlaySoundType, self).__init__(buffer, data=data)
 
 
 class StopSoundType(DataType):
+    __slots__ = ()
+
     def __init__(self, buffer: Buffer):
-        self.buffer = buffer
+        super(StopSoundType, self).__init__(buffer)
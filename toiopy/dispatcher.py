@@ -0,0 +1,151 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from toiopy.data import ToioException
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchedListener:
+    # 呼び出されるとlistenerの実行をDispatcherのキューに積む
+    __slots__ = ("listener", "_dispatcher")
+
+    def __init__(self, dispatcher: "Dispatcher", listener: Callable):
+        self.listener = listener
+        self._dispatcher = dispatcher
+
+    def __call__(self, *args):
+        self._dispatcher.submit(self, args)
+
+
+class Dispatcher:
+    # 通知のコールバックとlistenerの実行を切り離すキューとワーカースレッド
+    # 1つのDispatcherを複数のCubeで共有してもよい
+    # overflowはキューが一杯のときの動作
+    #   drop_oldest: 最も古いものを捨てる
+    #   block: 空きができるまで通知スレッドを待たせる
+    #   coalesce: 同じlistenerの未実行のものを最新の引数で置き換える。
+    #             置き換えられない場合は最も古いものを捨てる
+    # workersが2以上の場合、同じlistenerの呼び出しも並行に実行され、順序は保証されない
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+    COALESCE = "coalesce"
+
+    def __init__(
+        self,
+        max_queue_size: int = 1024,
+        workers: int = 1,
+        overflow: str = DROP_OLDEST,
+    ):
+        if overflow not in (
+            Dispatcher.DROP_OLDEST,
+            Dispatcher.BLOCK,
+            Dispatcher.COALESCE,
+        ):
+            raise ToioException("invalid argument: overflow")
+        if max_queue_size <= 0 or workers <= 0:
+            raise ToioException("invalid argument: max_queue_size and workers")
+
+        self._max_queue_size = max_queue_size
+        self._overflow = overflow
+        self._queue: Deque[List] = deque()
+        # coalesceで置き換えるための、listenerごとの未実行のエントリ
+        self._queued: Dict[DispatchedListener, List] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stats: Dict[str, int] = {
+            "submitted": 0,
+            "dispatched": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "max_depth": 0,
+        }
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def depth(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            stats = dict(self._stats)
+            stats["depth"] = len(self._queue)
+            return stats
+
+    def wrap(self, listener: Callable) -> DispatchedListener:
+        return DispatchedListener(self, listener)
+
+    def submit(self, listener: DispatchedListener, args: tuple):
+        with self._condition:
+            if self._closed:
+                return
+            self._stats["submitted"] += 1
+
+            if len(self._queue) >= self._max_queue_size:
+                entry = self._queued.get(listener)
+                if self._overflow == Dispatcher.COALESCE and entry is not None:
+                    entry[1] = args
+                    self._stats["coalesced"] += 1
+                    return
+                if self._overflow == Dispatcher.BLOCK:
+                    while len(self._queue) >= self._max_queue_size:
+                        self._condition.wait()
+                        if self._closed:
+                            return
+                else:
+                    dropped = self._queue.popleft()
+                    self._forget(dropped)
+                    self._stats["dropped"] += 1
+
+            entry = [listener, args]
+            self._queue.append(entry)
+            if self._overflow == Dispatcher.COALESCE:
+                self._queued[listener] = entry
+            if len(self._queue) > self._stats["max_depth"]:
+                self._stats["max_depth"] = len(self._queue)
+            self._condition.notify_all()
+
+    def close(self, timeout_sec: Optional[float] = None):
+        with self._condition:
+            self._closed = True
+            self._stats["dropped"] += len(self._queue)
+            self._queue.clear()
+            self._queued.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout_sec)
+
+    def _forget(self, entry: List):
+        if self._queued.get(entry[0]) is entry:
+            del self._queued[entry[0]]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                entry = self._queue.popleft()
+                self._forget(entry)
+                # blockで待っている通知スレッドを起こす
+                self._condition.notify_all()
+
+            listener, args = entry
+            try:
+                listener.listener(*args)
+            except Exception:
+                logger.exception("listener raised an exception")
+                with self._condition:
+                    self._stats["errors"] += 1
+            with self._condition:
+                self._stats["dispatched"] += 1
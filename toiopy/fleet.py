@@ -0,0 +1,159 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Union
+
+from toiopy.characteristic.specs import LightSpec, MotorSpec
+from toiopy.cube import Cube
+from toiopy.data import (
+    LightOperation,
+    MoveToOptions,
+    MoveToTarget,
+    SoundOperation,
+    ToioException,
+)
+from toiopy.scenario import LightScenario, SoundScenario
+
+
+class CubeResult(NamedTuple):
+    # futureはコマンドの完了、write_msは一斉送信の開始から書き込み完了までの時間
+    cube: Cube
+    future: Optional[Future]
+    error: Optional[Exception]
+    write_ms: float
+
+
+class ReadResult(NamedTuple):
+    # read_msは一斉読み出しの開始から値を受け取るまでの時間
+    cube: Cube
+    value: Any
+    error: Optional[Exception]
+    read_ms: float
+
+
+class CubeGroup:
+    # 複数のキューブへ同じコマンドを送る
+    # ペイロードは1度だけエンコードし、書き込みはスレッドプールで並行に行う
+    def __init__(self, cubes: List[Cube], max_workers: Optional[int] = None):
+        if not cubes:
+            raise ToioException("invalid argument: empty cubes")
+
+        self._cubes = list(cubes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(self._cubes))
+        self._motor_spec = MotorSpec()
+        self._light_spec = LightSpec()
+
+    @property
+    def cubes(self) -> List[Cube]:
+        return list(self._cubes)
+
+    def __len__(self) -> int:
+        return len(self._cubes)
+
+    def __iter__(self) -> Iterator[Cube]:
+        return iter(self._cubes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def move(
+        self,
+        left: int,
+        right: int,
+        duration: int,
+        without_response: Optional[bool] = None,
+    ) -> List[CubeResult]:
+        data = self._motor_spec.move(left, right, duration)
+        return self._broadcast(lambda cube: cube.write_move(data, without_response))
+
+    def move_to(
+        self,
+        targets: List[MoveToTarget],
+        options: MoveToOptions = MoveToOptions(0, 115, 0, 0, True),
+    ) -> List[CubeResult]:
+        # operation_idはキューブごとに異なるため、エンコードはキューブごとに行う
+        return self._broadcast(lambda cube: cube.move_to(targets, options))
+
+    def stop(self) -> List[CubeResult]:
+        return self.move(0, 0, 0)
+
+    def turn_on_light(
+        self, operation: LightOperation, without_response: Optional[bool] = None
+    ) -> List[CubeResult]:
+        data = self._light_spec.turn_on_light(operation)
+        return self._broadcast(
+            lambda cube: cube.write_turn_on_light(data, without_response)
+        )
+
+    def turn_on_light_with_scenario(
+        self,
+        operations: Union[List[LightOperation], LightScenario],
+        repeat_count: int = 0,
+    ) -> List[CubeResult]:
+        scenario = (
+            operations
+            if isinstance(operations, LightScenario)
+            else LightScenario.cached(operations, repeat_count)
+        )
+        return self._broadcast(lambda cube: cube.turn_on_light_with_scenario(scenario))
+
+    def play_sound(
+        self,
+        operations: Union[List[SoundOperation], SoundScenario],
+        repeat_count: int = 0,
+    ) -> List[CubeResult]:
+        scenario = (
+            operations
+            if isinstance(operations, SoundScenario)
+            else SoundScenario.cached(operations, repeat_count)
+        )
+        return self._broadcast(lambda cube: cube.play_sound(scenario))
+
+    def read_many(self, read: Callable[[Cube], Any]) -> List[ReadResult]:
+        # 各キューブの読み出しを並行に行い、全て揃ってから返す
+        started = time.perf_counter()
+
+        def run(cube: Cube) -> ReadResult:
+            try:
+                value = read(cube)
+                error = None
+            except Exception as e:
+                value, error = None, e
+            return ReadResult(
+                cube, value, error, (time.perf_counter() - started) * 1000
+            )
+
+        futures = [self._executor.submit(run, cube) for cube in self._cubes]
+        return [future.result() for future in futures]
+
+    def get_sensor_snapshots(
+        self, max_age_ms: Optional[float] = None
+    ) -> List[ReadResult]:
+        return self.read_many(lambda cube: cube.get_sensor_snapshot(max_age_ms))
+
+    def get_battery_statuses(
+        self, max_age_ms: Optional[float] = None
+    ) -> List[ReadResult]:
+        return self.read_many(lambda cube: cube.get_battery_status(max_age_ms))
+
+    def _broadcast(self, command: Callable[[Cube], Future]) -> List[CubeResult]:
+        started = time.perf_counter()
+
+        def run(cube: Cube) -> CubeResult:
+            try:
+                future = command(cube)
+                error = None
+            except Exception as e:
+                future, error = None, e
+            return CubeResult(
+                cube, future, error, (time.perf_counter() - started) * 1000
+            )
+
+        # 書き込みの完了を待って返す。コマンドの完了はCubeResult.futureで待つ
+        futures = [self._executor.submit(run, cube) for cube in self._cubes]
+        return [future.result() for future in futures]
@@ -0,0 +1,86 @@
+import threading
+from typing import Callable, Dict, Optional
+
+
+class Timing:
+    __slots__ = ("count", "total_ms", "min_ms", "max_ms", "last_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms: Optional[float] = None
+        self.max_ms: Optional[float] = None
+        self.last_ms: Optional[float] = None
+
+    def record(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+        self.max_ms = ms if self.max_ms is None else max(self.max_ms, ms)
+        self.last_ms = ms
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "min_ms": self.min_ms,
+            "max_ms": self.max_ms,
+            "last_ms": self.last_ms,
+        }
+
+
+class CubeMetrics:
+    # キューブごとのカウンタと処理時間
+    # 通知のたびに呼ばれるため、ロックを取ってdictを更新するだけにしている
+    NOTIFICATIONS = "notifications"
+    PARSE_ERRORS = "parse_errors"
+    WRITES = "writes"
+    WRITE_FAILURES = "write_failures"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            CubeMetrics.NOTIFICATIONS: 0,
+            CubeMetrics.PARSE_ERRORS: 0,
+            CubeMetrics.WRITES: 0,
+            CubeMetrics.WRITE_FAILURES: 0,
+        }
+        self._timings: Dict[str, Timing] = {}
+        self._sources: Dict[str, Callable[[], Dict]] = {}
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record_timing(self, name: str, ms: float):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = Timing()
+            timing.record(ms)
+
+    def add_source(self, name: str, source: Callable[[], Dict]):
+        # 他のオブジェクトが持つ統計をsnapshotに含める
+        self._sources[name] = source
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def reset(self):
+        with self._lock:
+            for name in self._counters:
+                self._counters[name] = 0
+            self._timings.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            snapshot: Dict = {
+                "counters": dict(self._counters),
+                "timings": {
+                    name: timing.to_dict() for name, timing in self._timings.items()
+                },
+            }
+        for name, source in self._sources.items():
+            snapshot[name] = source()
+        return snapshot
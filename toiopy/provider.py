@@ -0,0 +1,152 @@
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+from uuid import UUID
+
+# Adafruit_BluefruitLEのインターフェースのうち、toiopyが利用する部分
+# Adafruit_BluefruitLEのオブジェクトはこれらを継承していないが同じ形をしている
+
+TIMEOUT_SEC = 30
+
+# CBCharacteristicWriteTypeと同じ値。BlueZ版のwrite_valueはwrite_typeを受け付けない
+WRITE_WITH_RESPONSE = 0
+WRITE_WITHOUT_RESPONSE = 1
+
+
+class GattCharacteristic(ABC):
+    @property
+    @abstractmethod
+    def uuid(self) -> UUID:
+        pass
+
+    @abstractmethod
+    def read_value(self):
+        pass
+
+    @abstractmethod
+    def write_value(self, value, write_type: int = WRITE_WITH_RESPONSE):
+        pass
+
+    @abstractmethod
+    def start_notify(self, on_change: Callable):
+        pass
+
+    @abstractmethod
+    def stop_notify(self):
+        pass
+
+
+class GattService(ABC):
+    @property
+    @abstractmethod
+    def uuid(self) -> UUID:
+        pass
+
+    @abstractmethod
+    def list_characteristics(self) -> List[GattCharacteristic]:
+        pass
+
+    def find_characteristic(self, uuid: UUID) -> Optional[GattCharacteristic]:
+        for characteristic in self.list_characteristics():
+            if characteristic.uuid == uuid:
+                return characteristic
+        return None
+
+
+class Device(ABC):
+    @property
+    @abstractmethod
+    def id(self):
+        pass
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        pass
+
+    @property
+    @abstractmethod
+    def rssi(self) -> Optional[int]:
+        pass
+
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        pass
+
+    @abstractmethod
+    def connect(self, timeout_sec: float = TIMEOUT_SEC):
+        pass
+
+    @abstractmethod
+    def disconnect(self, timeout_sec: float = TIMEOUT_SEC):
+        pass
+
+    @abstractmethod
+    def discover(
+        self,
+        service_uuids: List[UUID],
+        char_uuids: List[UUID],
+        timeout_sec: float = TIMEOUT_SEC,
+    ):
+        pass
+
+    @abstractmethod
+    def list_services(self) -> List[GattService]:
+        pass
+
+    def find_service(self, uuid: UUID) -> Optional[GattService]:
+        for service in self.list_services():
+            if service.uuid == uuid:
+                return service
+        return None
+
+
+class Adapter(ABC):
+    @abstractmethod
+    def power_on(self):
+        pass
+
+    @abstractmethod
+    def start_scan(self, timeout_sec: float = TIMEOUT_SEC):
+        pass
+
+    @abstractmethod
+    def stop_scan(self, timeout_sec: float = TIMEOUT_SEC):
+        pass
+
+
+class Provider(ABC):
+    @abstractmethod
+    def initialize(self):
+        pass
+
+    @abstractmethod
+    def run_mainloop_with(self, target: Callable):
+        pass
+
+    @abstractmethod
+    def clear_cached_data(self):
+        pass
+
+    @abstractmethod
+    def get_default_adapter(self) -> Adapter:
+        pass
+
+    @abstractmethod
+    def disconnect_devices(self, service_uuids: List[UUID]):
+        pass
+
+    @abstractmethod
+    def find_devices(
+        self, service_uuids: List[UUID] = [], name: Optional[str] = None
+    ) -> List[Device]:
+        pass
+
+
+def get_provider():
+    # Adafruit_BluefruitLEは実機を使う場合にのみ必要とする
+    import Adafruit_BluefruitLE
+
+    provider = Adafruit_BluefruitLE.get_provider()
+    provider.initialize()
+    return provider
@@ -0,0 +1,423 @@
+import hashlib
+import logging
+import mmap
+import os
+from array import array
+from struct import error as StructError
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from toiopy.characteristic import codecs
+from toiopy.characteristics import IdCharacteristic, SensorCharacteristic
+from toiopy.data import ToioException
+from toiopy.recorder import (
+    FRAME_HEADER,
+    KIND_CHANNEL,
+    KIND_NOTIFY,
+    MAGIC,
+    parse_channel,
+)
+
+try:
+    import numpy as np
+except ImportError:  # numpyは任意の依存とする
+    np = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# cubeはcube_idsの添字
+POSITION_RECORD_DTYPE = (
+    np.dtype(
+        [
+            ("timestamp", "<f8"),
+            ("cube", "<u2"),
+            ("x", "<u2"),
+            ("y", "<u2"),
+            ("angle", "<u2"),
+            ("sensor_x", "<u2"),
+            ("sensor_y", "<u2"),
+        ]
+    )
+    if np is not None
+    else None
+)
+
+SENSOR_RECORD_DTYPE = (
+    np.dtype(
+        [
+            ("timestamp", "<f8"),
+            ("cube", "<u2"),
+            ("is_sloped", "?"),
+            ("is_collision_detected", "?"),
+            ("is_double_tapped", "?"),
+            ("orientation", "u1"),
+        ]
+    )
+    if np is not None
+    else None
+)
+
+# フレームヘッダ内の各フィールドの位置
+_LENGTH_OFFSET = 0
+_TIMESTAMP_OFFSET = 2
+_KIND_OFFSET = 10
+_CHANNEL_OFFSET = 11
+
+TIME_INDEX_STRIDE = 1024
+CHUNK_FRAMES = 1 << 20
+# 索引とファイルの対応を確かめるため、先頭からこの長さと最後のフレームのハッシュを保存する
+FINGERPRINT_HEAD_SIZE = 64 * 1024
+
+
+class RecordingReader:
+    # Recorderで記録したファイルをmmapし、位置とセンサーの通知をまとめて解析する
+    # 初回に全フレームの先頭位置を索引として作り、cache_indexの場合は
+    # <path>.idx.npzに保存して次回以降は追記された分だけを読む
+    # 保存した索引は、索引を作った範囲のハッシュ、ファイルサイズ、更新時刻が
+    # 追記のみと矛盾しない場合に限って使い、それ以外は作り直す
+    # 時刻の索引はtime_index_strideフレームごとの時刻のみを持ち、範囲の絞り込みに使う
+    # 時刻はRecorderが記録したUNIX時間で、戻らないことを前提に範囲を絞り込む
+    def __init__(
+        self,
+        path: str,
+        cache_index: bool = True,
+        time_index_stride: int = TIME_INDEX_STRIDE,
+    ):
+        if np is None:
+            raise ToioException("numpy is required for RecordingReader")
+        if time_index_stride <= 0:
+            raise ToioException("invalid argument: time_index_stride must be positive")
+
+        self._path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < len(MAGIC) or f.read(len(MAGIC)) != MAGIC:
+                raise ToioException("not a toiopy recording: %s" % path)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        index_path = path + ".idx.npz" if cache_index else None
+        self._offsets = self._build_index(index_path)
+        try:
+            self._load_channels()
+        except (ValueError, IndexError, StructError) as e:
+            # 索引が別のファイルのものだった場合に備え、先頭から読み直す
+            logger.warning("rebuilding index of %s: %s", path, e)
+            self._offsets = self._build_index(index_path, rebuild=True)
+            self._load_channels()
+        self._stride = time_index_stride
+        self._time_index = self._gather(
+            self._offsets[::time_index_stride], _TIMESTAMP_OFFSET, "<f8"
+        )
+
+    @property
+    def cube_ids(self) -> List[str]:
+        return list(self._cube_ids)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # 返した配列はコピーなのでmmapを閉じても参照できる
+        self._data = None
+        self._mmap.close()
+
+    @property
+    def time_range(self) -> Optional[Tuple[float, float]]:
+        if not len(self._offsets):
+            return None
+        last = self._gather(self._offsets[-1:], _TIMESTAMP_OFFSET, "<f8")
+        return float(self._time_index[0]), float(last[0])
+
+    def positions(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        cube_id: Optional[str] = None,
+    ):
+        return self._concatenate(
+            self.iter_positions(start, end, cube_id), POSITION_RECORD_DTYPE
+        )
+
+    def sensors(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        cube_id: Optional[str] = None,
+    ):
+        return self._concatenate(
+            self.iter_sensors(start, end, cube_id), SENSOR_RECORD_DTYPE
+        )
+
+    def iter_positions(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        cube_id: Optional[str] = None,
+        chunk_frames: int = CHUNK_FRAMES,
+    ) -> Iterator:
+        # start <= timestamp < end のposition-idをchunk_framesフレームごとに返す
+        for timestamps, cubes, rows in self._iter_notifications(
+            IdCharacteristic.UUID,
+            codecs.POSITION_ID.size,
+            1,
+            start,
+            end,
+            cube_id,
+            chunk_frames,
+        ):
+            # IdSpec.parseと同じく、種別の後にx, y, angle, sensor_x, sensor_yが並ぶ
+            fields = rows[:, 1:].copy().view("<u2")
+            records = np.empty(len(timestamps), dtype=POSITION_RECORD_DTYPE)
+            records["timestamp"] = timestamps
+            records["cube"] = cubes
+            for column, name in enumerate(("x", "y", "angle", "sensor_x", "sensor_y")):
+                records[name] = fields[:, column]
+            yield records
+
+    def iter_sensors(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        cube_id: Optional[str] = None,
+        chunk_frames: int = CHUNK_FRAMES,
+    ) -> Iterator:
+        for timestamps, cubes, rows in self._iter_notifications(
+            SensorCharacteristic.UUID,
+            codecs.SENSOR.size,
+            1,
+            start,
+            end,
+            cube_id,
+            chunk_frames,
+        ):
+            # SensorSpec.parseと同じ変換
+            records = np.empty(len(timestamps), dtype=SENSOR_RECORD_DTYPE)
+            records["timestamp"] = timestamps
+            records["cube"] = cubes
+            records["is_sloped"] = rows[:, 1] == 0
+            records["is_collision_detected"] = rows[:, 2] == 1
+            records["is_double_tapped"] = rows[:, 3] == 1
+            records["orientation"] = rows[:, 4]
+            yield records
+
+    def _iter_notifications(
+        self,
+        uuid: UUID,
+        size: int,
+        type_data: int,
+        start: Optional[float],
+        end: Optional[float],
+        cube_id: Optional[str],
+        chunk_frames: int,
+    ):
+        streams = [
+            stream
+            for stream, (stream_cube_id, stream_uuid) in enumerate(self._streams)
+            if stream_uuid == uuid and (cube_id is None or stream_cube_id == cube_id)
+        ]
+        if not streams:
+            return
+        wanted = np.zeros(len(self._streams), dtype=bool)
+        wanted[streams] = True
+
+        first, last = self._frame_range(start, end)
+        for lo in range(first, last, chunk_frames):
+            hi = min(lo + chunk_frames, last)
+            offsets = self._offsets[lo:hi]
+            kinds = self._data[offsets + _KIND_OFFSET]
+            lengths = self._gather(offsets, _LENGTH_OFFSET, "<u2")
+            mask = (kinds == KIND_NOTIFY) & (lengths >= size)
+            frames = np.flatnonzero(mask) + lo
+            if not len(frames):
+                continue
+
+            offsets = self._offsets[frames]
+            stream_ids = self._resolve_streams(frames, offsets)
+            mask = stream_ids >= 0
+            mask[mask] = wanted[stream_ids[mask]]
+            timestamps = self._gather(offsets, _TIMESTAMP_OFFSET, "<f8")
+            if start is not None:
+                mask &= timestamps >= start
+            if end is not None:
+                mask &= timestamps < end
+
+            payloads = offsets[mask] + FRAME_HEADER.size
+            rows = self._data[payloads[:, None] + np.arange(size)]
+            valid = rows[:, 0] == type_data
+            if not valid.any():
+                continue
+            cubes = self._stream_cubes[stream_ids[mask][valid]]
+            yield timestamps[mask][valid], cubes, rows[valid]
+
+    def _frame_range(
+        self, start: Optional[float], end: Optional[float]
+    ) -> Tuple[int, int]:
+        # 時刻の索引から対象になり得るフレームの範囲を求める。境界は呼び出し側で絞る
+        first, last = 0, len(self._offsets)
+        if start is not None:
+            # 同じ時刻のフレームが前のブロックにまたがっている場合も含める
+            block = np.searchsorted(self._time_index, start, side="left") - 1
+            first = max(int(block), 0) * self._stride
+        if end is not None:
+            block = np.searchsorted(self._time_index, end, side="left")
+            last = min(int(block) * self._stride, last)
+        return first, last
+
+    def _resolve_streams(self, frames, offsets):
+        # チャンネルは再宣言され得るため、各フレームの直前の宣言を探す
+        channels = self._gather(offsets, _CHANNEL_OFFSET, "<u2")
+        stream_ids = np.full(len(frames), -1, dtype=np.int64)
+        for channel, (positions, streams) in self._declarations.items():
+            mask = channels == channel
+            if not mask.any():
+                continue
+            found = np.searchsorted(positions, frames[mask], side="right") - 1
+            stream_ids[mask] = np.where(found >= 0, streams[found], -1)
+        return stream_ids
+
+    def _gather(self, offsets, field_offset: int, dtype: str):
+        # 各フレームの同じ位置のフィールドを集め、1次元の配列にする
+        itemsize = np.dtype(dtype).itemsize
+        index = offsets[:, None] + (field_offset + np.arange(itemsize))
+        return self._data[index].view(dtype).reshape(len(offsets))
+
+    def _load_channels(self):
+        kinds = self._data[self._offsets + _KIND_OFFSET]
+        declared = np.flatnonzero(kinds == KIND_CHANNEL)
+
+        self._cube_ids: List[str] = []
+        self._streams: List[Tuple[str, UUID]] = []
+        stream_cubes: List[int] = []
+        declarations: Dict[int, Tuple[List[int], List[int]]] = {}
+        for frame in declared:
+            offset = int(self._offsets[frame])
+            length, _, _, channel = FRAME_HEADER.unpack_from(self._mmap, offset)
+            payload_start = offset + FRAME_HEADER.size
+            stream = parse_channel(self._mmap[payload_start : payload_start + length])
+            if stream not in self._streams:
+                self._streams.append(stream)
+                if stream.cube_id not in self._cube_ids:
+                    self._cube_ids.append(stream.cube_id)
+                stream_cubes.append(self._cube_ids.index(stream.cube_id))
+            positions, streams = declarations.setdefault(channel, ([], []))
+            positions.append(int(frame))
+            streams.append(self._streams.index(stream))
+
+        self._stream_cubes = np.array(stream_cubes, dtype=np.uint16)
+        self._declarations = {
+            channel: (np.array(positions, dtype=np.int64), np.array(streams))
+            for channel, (positions, streams) in declarations.items()
+        }
+
+    def _build_index(self, index_path: Optional[str], rebuild: bool = False):
+        offsets = None
+        if index_path is not None and not rebuild and os.path.exists(index_path):
+            offsets = self._load_index(index_path)
+
+        position = len(MAGIC)
+        if offsets is not None and len(offsets):
+            position = self._frame_end(int(offsets[-1]))
+        scanned = self._scan(position)
+
+        if offsets is None or len(scanned):
+            offsets = np.concatenate(
+                [
+                    offsets if offsets is not None else np.empty(0, dtype=np.int64),
+                    np.frombuffer(scanned, dtype=np.int64),
+                ]
+            )
+            if index_path is not None:
+                self._save_index(index_path, offsets)
+        return offsets
+
+    def _load_index(self, index_path: str):
+        try:
+            with np.load(index_path) as index:
+                offsets = index["offsets"]
+                size = int(index["size"])
+                mtime_ns = int(index["mtime_ns"])
+                fingerprint = index["fingerprint"].tobytes()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if offsets.dtype != np.int64 or offsets.ndim != 1:
+            return None
+        stat = os.stat(self._path)
+        # 追記されていなければサイズも更新時刻も変わらない。
+        # サイズが同じで更新時刻だけが変わった場合は書き直されている
+        if stat.st_size < size or (
+            stat.st_size == size and stat.st_mtime_ns != mtime_ns
+        ):
+            return None
+        if len(offsets):
+            last = int(offsets[-1])
+            if last + FRAME_HEADER.size > len(self._mmap):
+                return None
+            if self._frame_end(last) > len(self._mmap):
+                return None
+        if self._fingerprint(offsets) != fingerprint:
+            return None
+        return offsets
+
+    def _save_index(self, index_path: str, offsets):
+        stat = os.stat(self._path)
+        try:
+            with open(index_path, "wb") as f:
+                np.savez(
+                    f,
+                    offsets=offsets,
+                    size=np.int64(stat.st_size),
+                    mtime_ns=np.int64(stat.st_mtime_ns),
+                    fingerprint=np.frombuffer(self._fingerprint(offsets), np.uint8),
+                )
+        except OSError:
+            pass
+
+    def _fingerprint(self, offsets) -> bytes:
+        # 先頭部分と索引の最後のフレームのハッシュ。追記では変わらない
+        digest = hashlib.blake2b(digest_size=16)
+        if len(offsets):
+            last = int(offsets[-1])
+            end = self._frame_end(last)
+            digest.update(self._mmap[: min(FINGERPRINT_HEAD_SIZE, end)])
+            digest.update(self._mmap[last:end])
+        else:
+            digest.update(self._mmap[: len(MAGIC)])
+        return digest.digest()
+
+    def _frame_end(self, offset: int) -> int:
+        return offset + FRAME_HEADER.size + self._length_at(offset)
+
+    def _length_at(self, offset: int) -> int:
+        data = self._mmap
+        return data[offset] | data[offset + 1] << 8
+
+    def _scan(self, position: int) -> array:
+        # フレームは可変長のため、先頭から長さをたどる
+        data = self._mmap
+        size = len(data)
+        header_size = FRAME_HEADER.size
+        offsets = array("q")
+        append = offsets.append
+        while position + header_size <= size:
+            end = position + header_size + (data[position] | data[position + 1] << 8)
+            if end > size:
+                # 書き込み途中で終了したファイルの末尾は無視する
+                break
+            append(position)
+            position = end
+        return offsets
+
+    @staticmethod
+    def _concatenate(chunks: Iterator, dtype):
+        arrays = list(chunks)
+        if not arrays:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(arrays)
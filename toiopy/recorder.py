@@ -0,0 +1,184 @@
+import threading
+import time
+from struct import Struct
+from typing import BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from toiopy.data import ToioException
+from toiopy.provider import (
+    WRITE_WITH_RESPONSE,
+    WRITE_WITHOUT_RESPONSE,
+    GattCharacteristic,
+)
+
+# ファイルの形式
+#   先頭にMAGIC、以降はフレームの連続
+#   フレーム: ペイロード長(uint16) 時刻(float64, UNIX時間) 種別(uint8) チャンネル(uint16)
+#             の後にペイロード
+#   チャンネルはキューブとcharacteristicの組で、KIND_CHANNELのフレームで宣言する
+#   宣言のペイロードはcharacteristicのUUID(16バイト)とキューブのid(UTF-8)
+#   同じチャンネルが再度宣言された場合、以降のフレームは新しい宣言に従う
+#   時刻はtime.time()だが、RecordingReaderの時刻の索引とReplayerの待ち時間は
+#   時刻が戻らないことを前提とするため、システム時刻が戻った場合も直前の時刻で記録する
+#   別のRecorderで追記した場合、その境界では時刻が戻ることがある
+MAGIC = b"TOIOREC1"
+FRAME_HEADER = Struct("<HdBH")
+
+KIND_CHANNEL = 0
+KIND_NOTIFY = 1
+KIND_WRITE = 2
+KIND_WRITE_WITHOUT_RESPONSE = 3
+KIND_READ = 4
+
+BUFFER_SIZE = 64 * 1024
+
+
+class Channel(NamedTuple):
+    cube_id: str
+    uuid: UUID
+
+
+class Frame(NamedTuple):
+    timestamp: float
+    kind: int
+    channel: int
+    payload: bytes
+
+
+class Recorder:
+    # キューブとの通信の生データをファイルに追記する
+    # 通知のコールバックから呼ばれるため、フレームはバッファに詰めるだけにして
+    # buffer_sizeを超えたときとflush/closeのときにまとめて書き込む
+    def __init__(self, path: str, buffer_size: int = BUFFER_SIZE):
+        self._file: Optional[BinaryIO] = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._channels: Dict[Tuple[str, UUID], int] = {}
+        self._last_timestamp = 0.0
+        self._stats: Dict[str, int] = {"frames": 0, "bytes": 0, "flushes": 0}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def channel(self, cube_id, uuid: UUID) -> int:
+        key = (str(cube_id), uuid)
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                channel = self._channels[key] = len(self._channels)
+                self._append(KIND_CHANNEL, channel, uuid.bytes + key[0].encode())
+            return channel
+
+    def record(self, kind: int, channel: int, payload):
+        with self._lock:
+            self._append(kind, channel, payload)
+            if len(self._buffer) >= self._buffer_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+
+    def wrap(self, cube_id, characteristic: GattCharacteristic) -> GattCharacteristic:
+        return RecordingCharacteristic(self, cube_id, characteristic)
+
+    def _append(self, kind: int, channel: int, payload):
+        if self._file is None:
+            return
+        timestamp = time.time()
+        if timestamp < self._last_timestamp:
+            timestamp = self._last_timestamp
+        self._last_timestamp = timestamp
+        buffer = self._buffer
+        buffer += FRAME_HEADER.pack(len(payload), timestamp, kind, channel)
+        buffer += payload
+        self._stats["frames"] += 1
+
+    def _flush(self):
+        if self._file is None or not self._buffer:
+            return
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._stats["bytes"] += len(self._buffer)
+        self._stats["flushes"] += 1
+        self._buffer = bytearray()
+
+
+class RecordingCharacteristic(GattCharacteristic):
+    # characteristicを包み、通知、書き込み、読み出しをRecorderに記録する
+    def __init__(self, recorder: Recorder, cube_id, characteristic: GattCharacteristic):
+        self._recorder = recorder
+        self._characteristic = characteristic
+        self._channel = recorder.channel(cube_id, characteristic.uuid)
+
+    @property
+    def uuid(self) -> UUID:
+        return self._characteristic.uuid
+
+    def read_value(self):
+        data = self._characteristic.read_value()
+        if data:
+            self._recorder.record(KIND_READ, self._channel, data)
+        return data
+
+    def write_value(self, value, write_type: int = WRITE_WITH_RESPONSE):
+        if write_type == WRITE_WITHOUT_RESPONSE:
+            self._recorder.record(KIND_WRITE_WITHOUT_RESPONSE, self._channel, value)
+            self._characteristic.write_value(value, write_type)
+        else:
+            # BlueZ版はwrite_typeを受け付けないため、応答付きの場合は渡さない
+            self._recorder.record(KIND_WRITE, self._channel, value)
+            self._characteristic.write_value(value)
+
+    def start_notify(self, on_change: Callable):
+        recorder = self._recorder
+        channel = self._channel
+
+        def recorded(data):
+            recorder.record(KIND_NOTIFY, channel, data)
+            on_change(data)
+
+        self._characteristic.start_notify(recorded)
+
+    def stop_notify(self):
+        self._characteristic.stop_notify()
+
+
+def read_frames(path: str) -> Iterator[Frame]:
+    # KIND_CHANNELを含む全てのフレームを記録された順に返す
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ToioException("not a toiopy recording: %s" % path)
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                # 書き込み途中で終了したファイルの末尾は無視する
+                return
+            length, timestamp, kind, channel = FRAME_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield Frame(timestamp, kind, channel, payload)
+
+
+def parse_channel(payload: bytes) -> Channel:
+    return Channel(payload[16:].decode(), UUID(bytes=bytes(payload[:16])))
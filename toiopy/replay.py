@@ -0,0 +1,240 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from toiopy.characteristics import ConfigurationCharacteristic
+from toiopy.cube import Cube
+from toiopy.provider import (
+    TIMEOUT_SEC,
+    WRITE_WITH_RESPONSE,
+    Device,
+    GattCharacteristic,
+    GattService,
+)
+from toiopy.recorder import (
+    KIND_CHANNEL,
+    KIND_NOTIFY,
+    KIND_READ,
+    KIND_WRITE,
+    KIND_WRITE_WITHOUT_RESPONSE,
+    parse_channel,
+    read_frames,
+)
+
+
+class ReplayCharacteristic(GattCharacteristic):
+    # 記録された通知をcharacteristicのクラスへ渡す。書き込みは捨てる
+    def __init__(self, uuid: UUID):
+        self._uuid = uuid
+        self._on_change: Optional[Callable] = None
+        self._last_read: Optional[bytes] = None
+
+    @property
+    def uuid(self) -> UUID:
+        return self._uuid
+
+    def read_value(self):
+        # 記録中に最後に読み出された値を返す
+        return self._last_read
+
+    def write_value(self, value, write_type: int = WRITE_WITH_RESPONSE):
+        pass
+
+    def start_notify(self, on_change: Callable):
+        self._on_change = on_change
+
+    def stop_notify(self):
+        self._on_change = None
+
+    def _notify(self, data: bytes):
+        on_change = self._on_change
+        if on_change is not None:
+            on_change(data)
+
+
+class ReplayService(GattService):
+    def __init__(self, characteristics: List[GattCharacteristic]):
+        self._characteristics = characteristics
+
+    @property
+    def uuid(self) -> UUID:
+        return Cube.TOIO_SERVICE_ID
+
+    def list_characteristics(self) -> List[GattCharacteristic]:
+        return list(self._characteristics)
+
+
+class ReplayConfigurationCharacteristic(ReplayCharacteristic):
+    # 接続時のBLEプロトコルバージョンの要求に、記録された応答を返す
+    def __init__(self, uuid: UUID, version_response: bytes):
+        super(ReplayConfigurationCharacteristic, self).__init__(uuid)
+        self._version_response = version_response
+
+    def write_value(self, value, write_type: int = WRITE_WITH_RESPONSE):
+        if value and value[0] == 0x01:
+            self._notify(self._version_response)
+
+
+class ReplayDevice(Device):
+    # 記録で宣言されたcharacteristicを持ち、Cube.connectからは通常の端末と同じに見える
+    # 記録に応答が残っていない場合に返すBLEプロトコルのバージョン
+    VERSION_RESPONSE = bytes([0x81, 0x00]) + b"2.1.0"
+
+    def __init__(self, cube_id: str, version_response: Optional[bytes] = None):
+        self._id = cube_id
+        self._version_response = version_response or ReplayDevice.VERSION_RESPONSE
+        self._characteristics: Dict[UUID, ReplayCharacteristic] = {}
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def name(self) -> str:
+        return "toio Core Cube"
+
+    @property
+    def rssi(self) -> Optional[int]:
+        return None
+
+    @property
+    def is_connected(self) -> bool:
+        return True
+
+    def connect(self, timeout_sec: float = TIMEOUT_SEC):
+        pass
+
+    def disconnect(self, timeout_sec: float = TIMEOUT_SEC):
+        pass
+
+    def discover(
+        self,
+        service_uuids: List[UUID],
+        char_uuids: List[UUID],
+        timeout_sec: float = TIMEOUT_SEC,
+    ):
+        pass
+
+    def list_services(self) -> List[GattService]:
+        return [ReplayService(list(self._characteristics.values()))]
+
+    def characteristic(self, uuid: UUID) -> ReplayCharacteristic:
+        characteristic = self._characteristics.get(uuid)
+        if characteristic is None:
+            if uuid == ConfigurationCharacteristic.UUID:
+                characteristic = ReplayConfigurationCharacteristic(
+                    uuid, self._version_response
+                )
+            else:
+                characteristic = ReplayCharacteristic(uuid)
+            self._characteristics[uuid] = characteristic
+        return characteristic
+
+
+class Replayer:
+    # Recorderで記録したファイルを再生する
+    # 最初の再生の前にファイル全体からチャンネルの宣言を集め、キューブごとにReplayDeviceを
+    # 作ってCube.connectで接続する
+    # 通知は記録時と同じcharacteristicのクラスを通してCubeのイベントとして発行される
+    # speedがNoneの場合は待たずに最大速度で再生する
+    def __init__(
+        self,
+        path: str,
+        cube_factory: Callable[[Device], Cube] = Cube,
+    ):
+        self._path = path
+        self._cube_factory = cube_factory
+        self._cubes: Dict[str, Cube] = {}
+        self._devices: Dict[str, ReplayDevice] = {}
+        self._listeners: List[Tuple[str, Callable, dict]] = []
+        self._stop = threading.Event()
+
+    @property
+    def cubes(self) -> Dict[str, Cube]:
+        self._load()
+        return dict(self._cubes)
+
+    def on(self, event: str, listener: Callable, **options):
+        # 全てのキューブに登録する。まだ接続していないキューブには接続時に登録する
+        self._listeners.append((event, listener, options))
+        for cube in self._cubes.values():
+            cube.on(event, listener, **options)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, speed: Optional[float] = 1.0) -> Dict[str, float]:
+        self._load()
+        self._stop.clear()
+        channels: Dict[int, ReplayCharacteristic] = {}
+        stats: Dict[str, float] = {
+            "frames": 0,
+            "notifications": 0,
+            "reads": 0,
+            "writes": 0,
+        }
+        first: Optional[float] = None
+        started = time.perf_counter()
+
+        for timestamp, kind, channel, payload in read_frames(self._path):
+            if self._stop.is_set():
+                break
+            stats["frames"] += 1
+            if kind == KIND_CHANNEL:
+                cube_id, uuid = parse_channel(payload)
+                channels[channel] = self._devices[cube_id].characteristic(uuid)
+                continue
+
+            if speed is not None:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / speed - (time.perf_counter() - started)
+                if delay > 0 and self._stop.wait(delay):
+                    break
+
+            characteristic = channels.get(channel)
+            if characteristic is None:
+                continue
+            if kind == KIND_NOTIFY:
+                stats["notifications"] += 1
+                characteristic._notify(payload)
+            elif kind == KIND_READ:
+                stats["reads"] += 1
+                characteristic._last_read = payload
+            elif kind in (KIND_WRITE, KIND_WRITE_WITHOUT_RESPONSE):
+                stats["writes"] += 1
+
+        stats["elapsed_sec"] = time.perf_counter() - started
+        return stats
+
+    def _load(self) -> None:
+        if self._devices:
+            return
+
+        declared: Dict[int, Tuple[str, UUID]] = {}
+        uuids: Dict[str, List[UUID]] = {}
+        version_responses: Dict[str, bytes] = {}
+        for _, kind, channel, payload in read_frames(self._path):
+            if kind == KIND_CHANNEL:
+                cube_id, uuid = declared[channel] = parse_channel(payload)
+                uuids.setdefault(cube_id, []).append(uuid)
+            elif kind == KIND_NOTIFY and channel in declared:
+                cube_id, uuid = declared[channel]
+                if (
+                    uuid == ConfigurationCharacteristic.UUID
+                    and payload[:1] == b"\x81"
+                    and cube_id not in version_responses
+                ):
+                    version_responses[cube_id] = payload
+
+        for cube_id, cube_uuids in uuids.items():
+            device = ReplayDevice(cube_id, version_responses.get(cube_id))
+            for uuid in cube_uuids:
+                device.characteristic(uuid)
+            self._devices[cube_id] = device
+            cube = self._cubes[cube_id] = self._cube_factory(device)
+            cube.connect()
+            for event, listener, options in self._listeners:
+                cube.on(event, listener, **options)
@@ -1,29 +1,31 @@
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Union, List
-
-import Adafruit_BluefruitLE
-from Adafruit_BluefruitLE.interfaces.device import Device
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Any, List, Optional, Union
 
 from toiopy.cube import Cube
 from toiopy.data import ToioException, ToioEventEmitter
-from toiopy.util import set_timeout
+from toiopy.provider import Device, get_provider
+
+logger = logging.getLogger(__name__)
 
 
 class Scanner(ABC):
     DEFAULT_TIMEOUT_MS: int = 0
+    POLL_INTERVAL_MS: int = 100
 
     def __init__(self, provider, timeout_ms: int = DEFAULT_TIMEOUT_MS):
         self._timout_ms = timeout_ms
         self._event_emitter: ToioEventEmitter = ToioEventEmitter()
 
         self._provider = provider
-        self._peripherals: Union[Device, List[Device]] = None
+        self._peripherals: List[Device] = []
 
     @classmethod
     def get_provider(cls):
-        provider = Adafruit_BluefruitLE.get_provider()
-        provider.initialize()
-        return provider
+        return get_provider()
 
     def start(self):
         self._provider.clear_cached_data()
@@ -49,6 +51,53 @@ class Scanner(ABC):
     def discover(self):
         pass
 
+    def _wait_for_devices(
+        self,
+        provider,
+        count: int = 1,
+        window_ms: int = 0,
+        timeout_ms: Optional[int] = None,
+    ) -> List[Device]:
+        # 固定時間のsleepではなく、必要数が見つかるまでポーリングする
+        # window_msを指定した場合は、後から見つかるより近いキューブを取りこぼさないよう
+        # 必要数が見つかってもwindow_msが経過するまで探し続ける
+        # timeout_ms(省略時はScannerのtimeout_ms)が経過したら見つかった分を返す
+        # timeout_msが0の場合はwindow_msの経過で打ち切る
+        if timeout_ms is None:
+            timeout_ms = self._timout_ms
+        limit_ms = timeout_ms if timeout_ms > 0 else window_ms
+        started = time.monotonic()
+        while True:
+            peripherals = self._find_toio_devices(provider)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            if len(peripherals) >= count and elapsed_ms >= window_ms:
+                return peripherals
+            if elapsed_ms >= limit_ms:
+                return peripherals
+            time.sleep(Scanner.POLL_INTERVAL_MS / 1000)
+
+    @staticmethod
+    def _find_toio_devices(provider) -> List[Device]:
+        found = provider.find_devices([Cube.TOIO_SERVICE_ID]) or []
+        found = found if type(found) is list else [found]
+        return [p for p in found if p.name and "toio" in p.name]
+
+    @staticmethod
+    def _read_rssi(peripheral: Device, timeout_ms: int) -> int:
+        if hasattr(peripheral, "_rssi_read"):
+            # CoreBluetoothはアドバタイズのRSSIを保持しないため接続して読み出す
+            device: Any = peripheral
+            if not device.is_connected:
+                device.connect()
+            device._rssi_read.clear()
+            device._peripheral.readRSSI()
+            if not device._rssi_read.wait(timeout_ms / 1000):
+                raise ToioException("Exceeded timeout waiting for RSSI value!")
+            rssi = device._rssi
+        else:
+            rssi = peripheral.rssi
+        return rssi if rssi is not None else -128
+
     @abstractmethod
     def executor(self) -> Union[Cube, List[Cube]]:
         pass
@@ -69,29 +118,112 @@ class NearestScanner(Scanner):
         self._nearest_peripheral = None
 
     def discover(self, provider):
-        set_timeout(lambda: None, NearestScanner.SCAN_WINDOW_MS)
-        peripherals = provider.find_devices([Cube.TOIO_SERVICE_ID])
-        if peripherals is None:
+        peripherals = self._wait_for_devices(provider, 1, self._scan_window_ms)
+        if not peripherals:
             raise ToioException("Failed to find device")
 
-        peripherals = peripherals if type(peripherals) is list else [peripherals]
-        print("{0} device discover".format(len(peripherals)))
+        logger.info("%d devices discovered", len(peripherals))
+        nearest_rssi = None
+        for peripheral in peripherals:
+            rssi = self._read_rssi(peripheral, self._scan_window_ms)
+            if nearest_rssi is None or rssi > nearest_rssi:
+                nearest_rssi = rssi
+                self._nearest_peripheral = peripheral
+
         for peripheral in peripherals:
-            if "toio" in peripheral.name:
-                peripheral.connect()
-                set_timeout(lambda: None, NearestScanner.SCAN_WINDOW_MS)
-                peripheral._peripheral.readRSSI()
-                if not peripheral._rssi_read.wait(NearestScanner.SCAN_WINDOW_MS / 1000):
-                    raise RuntimeError("Exceeded timeout waiting for RSSI value!")
-                if (
-                    self._nearest_peripheral is None
-                    or peripheral._rssi > self._nearest_peripheral._rssi
-                ):
-                    self._nearest_peripheral = peripheral
-                set_timeout(lambda: None, NearestScanner.SCAN_WINDOW_MS)
-        print("discovered")
+            if peripheral is not self._nearest_peripheral and peripheral.is_connected:
+                peripheral.disconnect()
+        logger.debug("nearest device discovered")
 
     def executor(self) -> Cube:
         if self._nearest_peripheral is None:
             raise ToioException("Failed to find device")
         return Cube(self._nearest_peripheral)
+
+
+class MultipleScanner(Scanner):
+
+    RSSI_TIMEOUT_MS: int = 1000
+    DEFAULT_MAX_CONCURRENCY: int = 4
+    DEFAULT_DEADLINE_MS: int = 30000
+
+    def __init__(
+        self,
+        provider,
+        count: int = 2,
+        deadline_ms: int = DEFAULT_DEADLINE_MS,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        # deadline_msは探索から接続までの全体の期限
+        # 必要数が見つからない場合の探索は期限の半分で打ち切り、見つかった分に残りで接続する
+        if deadline_ms <= 0:
+            raise ToioException("invalid argument: deadline_ms must be positive")
+        super(MultipleScanner, self).__init__(provider, deadline_ms)
+        self._count = count
+        self._max_concurrency = max_concurrency
+        self._deadline_ms = deadline_ms
+        self._deadline = 0.0
+
+    def start(self):
+        self._deadline = time.monotonic() + self._deadline_ms / 1000
+        return super(MultipleScanner, self).start()
+
+    def _remaining_ms(self) -> int:
+        return max(int((self._deadline - time.monotonic()) * 1000), 0)
+
+    def discover(self, provider):
+        peripherals = self._wait_for_devices(
+            provider, self._count, timeout_ms=max(self._remaining_ms() // 2, 1)
+        )
+        if not peripherals:
+            raise ToioException("Failed to find device")
+        if len(peripherals) < self._count:
+            logger.warning(
+                "only %d of %d devices discovered", len(peripherals), self._count
+            )
+
+        # 必要数より多く見つかった場合のみRSSIで選別する
+        if len(peripherals) > self._count:
+            rssi_timeout_ms = min(MultipleScanner.RSSI_TIMEOUT_MS, self._remaining_ms())
+            rssi = {
+                peripheral.id: self._read_rssi(peripheral, rssi_timeout_ms)
+                for peripheral in peripherals
+            }
+            peripherals.sort(key=lambda peripheral: rssi[peripheral.id], reverse=True)
+            for peripheral in peripherals[self._count :]:
+                if peripheral.is_connected:
+                    peripheral.disconnect()
+        self._peripherals = peripherals[: self._count]
+        logger.info("%d devices discovered", len(self._peripherals))
+
+    def executor(self) -> List[Cube]:
+        if not self._peripherals:
+            raise ToioException("Failed to find device")
+
+        remaining_ms = self._remaining_ms()
+        if remaining_ms <= 0:
+            raise ToioException("Exceeded deadline before connecting devices")
+        cubes = [Cube(peripheral) for peripheral in self._peripherals]
+        pool = ThreadPoolExecutor(max_workers=self._max_concurrency)
+        futures = {
+            pool.submit(cube.connect, timeout_ms=remaining_ms): cube for cube in cubes
+        }
+        done, not_done = wait(futures, timeout=remaining_ms / 1000)
+        pool.shutdown(wait=False)
+
+        # 期限に間に合わなかったキューブは接続完了後に切断する
+        for future in not_done:
+            future.add_done_callback(partial(self._disconnect_late, futures[future]))
+
+        connected = [
+            futures[future]
+            for future in done
+            if future.exception() is None and futures[future].is_connected
+        ]
+        if not connected:
+            raise ToioException("Failed to connect device")
+        return [cube for cube in cubes if cube in connected]
+
+    @staticmethod
+    def _disconnect_late(cube: Cube, future: Future):
+        cube.disconnect()
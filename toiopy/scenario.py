@@ -0,0 +1,76 @@
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
+
+from toiopy.characteristic.specs import LightSpec, SoundSpec
+from toiopy.data import LightOperation, SoundOperation, ToioException
+
+SCENARIO_CACHE_SIZE = 128
+
+
+class LightScenario(NamedTuple):
+    # エンコード済みのturn_on_light_with_scenario。同じシナリオを繰り返し送る場合に使う
+    payload: bytes
+    total_duration_ms: int
+
+    @property
+    def repeats_forever(self) -> bool:
+        # 繰り返し回数0は置き換えられるまで繰り返す
+        return self.payload[1] == 0
+
+    @classmethod
+    def compile(
+        cls, operations: List[LightOperation], repeat_count: int = 0
+    ) -> "LightScenario":
+        if not operations:
+            raise ToioException("invalid argument: empty operation")
+        data = LightSpec().turn_on_light_with_scenario(operations, repeat_count)
+        return cls(bytes(data.buffer.byte_data), data.data.total_duration_ms)
+
+    @classmethod
+    def cached(
+        cls, operations: List[LightOperation], repeat_count: int = 0
+    ) -> "LightScenario":
+        key = tuple((op.duration_ms, op.red, op.green, op.blue) for op in operations)
+        return _compile_light_scenario(key, repeat_count)
+
+
+class SoundScenario(NamedTuple):
+    # エンコード済みのplay_sound
+    payload: bytes
+    total_duration_ms: int
+
+    @property
+    def repeats_forever(self) -> bool:
+        # 繰り返し回数0は置き換えられるまで繰り返す
+        return self.payload[1] == 0
+
+    @classmethod
+    def compile(
+        cls, operations: List[SoundOperation], repeat_count: int = 0
+    ) -> "SoundScenario":
+        data = SoundSpec().play_sound(operations, repeat_count)
+        return cls(bytes(data.buffer.byte_data), data.data.total_duration_ms)
+
+    @classmethod
+    def cached(
+        cls, operations: List[SoundOperation], repeat_count: int = 0
+    ) -> "SoundScenario":
+        key = tuple((op.duration_ms, op.note_name) for op in operations)
+        return _compile_sound_scenario(key, repeat_count)
+
+
+# 都度指定されたシナリオは内容をキーにコンパイル結果を使い回す
+@lru_cache(maxsize=SCENARIO_CACHE_SIZE)
+def _compile_light_scenario(
+    key: Tuple[Tuple[int, int, int, int], ...], repeat_count: int
+) -> LightScenario:
+    return LightScenario.compile(
+        [LightOperation(*operation) for operation in key], repeat_count
+    )
+
+
+@lru_cache(maxsize=SCENARIO_CACHE_SIZE)
+def _compile_sound_scenario(key: Tuple[tuple, ...], repeat_count: int) -> SoundScenario:
+    return SoundScenario.compile(
+        [SoundOperation(*operation) for operation in key], repeat_count
+    )
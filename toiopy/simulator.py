@@ -0,0 +1,494 @@
+import heapq
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from uuid import UUID
+
+from toiopy.characteristic import codecs
+from toiopy.characteristics import (
+    BatteryCharacteristic,
+    ButtonCharacteristic,
+    ConfigurationCharacteristic,
+    IdCharacteristic,
+    MotorCharacteristic,
+    SensorCharacteristic,
+)
+from toiopy.cube import Cube
+from toiopy.provider import (
+    TIMEOUT_SEC,
+    WRITE_WITH_RESPONSE,
+    WRITE_WITHOUT_RESPONSE,
+    Adapter,
+    Device,
+    GattCharacteristic,
+    GattService,
+    Provider,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatorScheduler:
+    # 全ての仮想キューブの通知を1本のスレッドで時刻順に発火する
+    def __init__(self):
+        self._queue: list = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._queue = []
+            self._condition.notify()
+
+    def call_later(self, delay_ms: float, callback: Callable):
+        due = time.monotonic() + delay_ms / 1000
+        with self._condition:
+            heapq.heappush(self._queue, (due, next(self._counter), callback))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    now = time.monotonic()
+                    if self._queue and self._queue[0][0] <= now:
+                        break
+                    timeout = self._queue[0][0] - now if self._queue else None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                _, _, callback = heapq.heappop(self._queue)
+            try:
+                callback()
+            except Exception:
+                logger.exception("simulator callback raised an exception")
+
+
+class SimulatedGattCharacteristic(GattCharacteristic):
+    def __init__(
+        self,
+        device: "SimulatedDevice",
+        uuid: UUID,
+        on_write: Optional[Callable[[bytes], None]] = None,
+        on_read: Optional[Callable[[], bytes]] = None,
+    ):
+        self._device = device
+        self._uuid = uuid
+        self._on_write = on_write
+        self._on_read = on_read
+        self._on_change: Optional[Callable] = None
+
+    @property
+    def uuid(self) -> UUID:
+        return self._uuid
+
+    def read_value(self):
+        if self._on_read is None:
+            return None
+        self._device._read()
+        return bytearray(self._on_read())
+
+    def write_value(self, value, write_type: int = WRITE_WITH_RESPONSE):
+        self._device._write(self, bytes(value), write_type)
+
+    def start_notify(self, on_change: Callable):
+        self._on_change = on_change
+
+    def stop_notify(self):
+        self._on_change = None
+
+    def _notify(self, data: bytes):
+        on_change = self._on_change
+        if on_change is not None and self._device._deliver():
+            on_change(data)
+
+
+class SimulatedGattService(GattService):
+    def __init__(self, uuid: UUID, characteristics: List[GattCharacteristic]):
+        self._uuid = uuid
+        self._characteristics = characteristics
+
+    @property
+    def uuid(self) -> UUID:
+        return self._uuid
+
+    def list_characteristics(self) -> List[GattCharacteristic]:
+        return list(self._characteristics)
+
+
+class SimulatedDevice(Device):
+
+    BLE_PROTOCOL_VERSION = b"2.1.0"
+    # マットの座標範囲
+    MAT_MIN = 45
+    MAT_MAX = 455
+
+    def __init__(self, provider: "SimulatedProvider", index: int):
+        self._provider = provider
+        self._id = UUID(int=index + 1)
+        self._rssi = -40 - 5 * index
+        self._connected = False
+        self._session = 0
+        self._lock = threading.Lock()
+
+        self._x = 250.0
+        self._y = 250.0
+        self._angle = 0.0
+        self._left = 0
+        self._right = 0
+        self._motor_token = 0
+        # (operation_id, 応答の種別, 所要時間ms)
+        self._operations: List[tuple] = []
+        self._battery_level = 100
+
+        self.stats: Dict[str, int] = {
+            "writes": 0,
+            "writes_lost": 0,
+            "writes_without_response": 0,
+            "reads": 0,
+            "notifications": 0,
+            "notifications_lost": 0,
+        }
+
+        self._id_characteristic = SimulatedGattCharacteristic(
+            self, IdCharacteristic.UUID
+        )
+        self._sensor_characteristic = SimulatedGattCharacteristic(
+            self, SensorCharacteristic.UUID, on_read=self._sensor_payload
+        )
+        self._motor_characteristic = SimulatedGattCharacteristic(
+            self, MotorCharacteristic.UUID, on_write=self._on_motor_write
+        )
+        self._configuration_characteristic = SimulatedGattCharacteristic(
+            self,
+            ConfigurationCharacteristic.UUID,
+            on_write=self._on_configuration_write,
+        )
+        characteristics: List[GattCharacteristic] = []
+        for uuid in Cube._characteristics:
+            if uuid == IdCharacteristic.UUID:
+                characteristics.append(self._id_characteristic)
+            elif uuid == SensorCharacteristic.UUID:
+                characteristics.append(self._sensor_characteristic)
+            elif uuid == MotorCharacteristic.UUID:
+                characteristics.append(self._motor_characteristic)
+            elif uuid == ConfigurationCharacteristic.UUID:
+                characteristics.append(self._configuration_characteristic)
+            elif uuid == BatteryCharacteristic.UUID:
+                characteristics.append(
+                    SimulatedGattCharacteristic(
+                        self, uuid, on_read=lambda: bytes([self._battery_level])
+                    )
+                )
+            elif uuid == ButtonCharacteristic.UUID:
+                characteristics.append(
+                    SimulatedGattCharacteristic(
+                        self, uuid, on_read=lambda: bytes([0x01, 0x00])
+                    )
+                )
+            else:
+                characteristics.append(SimulatedGattCharacteristic(self, uuid))
+        self._service = SimulatedGattService(Cube.TOIO_SERVICE_ID, characteristics)
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def name(self) -> str:
+        return "toio Core Cube"
+
+    @property
+    def rssi(self) -> Optional[int]:
+        return self._rssi
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def connect(self, timeout_sec: float = TIMEOUT_SEC):
+        if self._provider.connect_latency_ms > 0:
+            time.sleep(self._provider.connect_latency_ms / 1000)
+        with self._lock:
+            if self._connected:
+                return
+            self._connected = True
+            self._session += 1
+            session = self._session
+        self._schedule_position_id(session)
+        self._schedule_sensor(session)
+
+    def disconnect(self, timeout_sec: float = TIMEOUT_SEC):
+        with self._lock:
+            self._connected = False
+            self._session += 1
+
+    def discover(
+        self,
+        service_uuids: List[UUID],
+        char_uuids: List[UUID],
+        timeout_sec: float = TIMEOUT_SEC,
+    ):
+        pass
+
+    def list_services(self) -> List[GattService]:
+        return [self._service]
+
+    def _deliver(self) -> bool:
+        if not self._connected:
+            return False
+        if self._provider._lost():
+            self.stats["notifications_lost"] += 1
+            return False
+        self.stats["notifications"] += 1
+        return True
+
+    def _read(self):
+        if not self._connected:
+            raise RuntimeError("device is not connected")
+        # 読み出しは応答付き書き込みと同じく1往復かかる
+        if self._provider.write_latency_ms > 0:
+            time.sleep(self._provider.write_latency_ms / 1000)
+        self.stats["reads"] += 1
+
+    def _write(
+        self,
+        characteristic: SimulatedGattCharacteristic,
+        value: bytes,
+        write_type: int = WRITE_WITH_RESPONSE,
+    ):
+        if not self._connected:
+            raise RuntimeError("device is not connected")
+        # 応答なし書き込みはキューブの応答を待たずに戻る
+        if write_type == WRITE_WITH_RESPONSE and self._provider.write_latency_ms > 0:
+            time.sleep(self._provider.write_latency_ms / 1000)
+        if self._provider._lost():
+            self.stats["writes_lost"] += 1
+            return
+        self.stats["writes"] += 1
+        if write_type == WRITE_WITHOUT_RESPONSE:
+            self.stats["writes_without_response"] += 1
+        if characteristic._on_write is not None:
+            characteristic._on_write(value)
+
+    # periodic notification
+    def _schedule_position_id(self, session: int):
+        rate_hz = self._provider.position_id_rate_hz
+        if rate_hz <= 0:
+            return
+        interval_ms = 1000 / rate_hz
+
+        def tick():
+            if self._session != session:
+                return
+            self._advance(interval_ms)
+            self._id_characteristic._notify(self._position_id_payload())
+            self._provider._scheduler.call_later(interval_ms, tick)
+
+        self._provider._scheduler.call_later(interval_ms, tick)
+
+    def _schedule_sensor(self, session: int):
+        rate_hz = self._provider.sensor_rate_hz
+        if rate_hz <= 0:
+            return
+        interval_ms = 1000 / rate_hz
+
+        def tick():
+            if self._session != session:
+                return
+            self._sensor_characteristic._notify(self._sensor_payload())
+            self._provider._scheduler.call_later(interval_ms, tick)
+
+        self._provider._scheduler.call_later(interval_ms, tick)
+
+    def _advance(self, elapsed_ms: float):
+        # 左右のモーター出力から簡易的に位置と角度を進める
+        with self._lock:
+            dt = elapsed_ms / 1000
+            speed = (self._left + self._right) / 2
+            self._angle = (self._angle + (self._left - self._right) * dt) % 360
+            rad = math.radians(self._angle)
+            self._x += speed * math.cos(rad) * dt
+            self._y += speed * math.sin(rad) * dt
+            self._x = min(max(self._x, self.MAT_MIN), self.MAT_MAX)
+            self._y = min(max(self._y, self.MAT_MIN), self.MAT_MAX)
+
+    def _position_id_payload(self) -> bytes:
+        x, y, angle = int(self._x), int(self._y), int(self._angle)
+        return codecs.POSITION_ID.pack(1, x, y, angle, x, y)
+
+    def _sensor_payload(self) -> bytes:
+        return codecs.SENSOR.pack(1, 1, 0, 0, 1)
+
+    # write handler
+    def _on_configuration_write(self, value: bytes):
+        if value[:2] == b"\x01\x00":
+            payload = bytes([0x81, 0x00]) + self.BLE_PROTOCOL_VERSION
+            self._provider._scheduler.call_later(
+                0, lambda: self._configuration_characteristic._notify(payload)
+            )
+
+    def _on_motor_write(self, value: bytes):
+        command = value[0]
+        if command in (1, 2):
+            l_power = value[3] if value[2] == 1 else -value[3]
+            r_power = value[6] if value[5] == 1 else -value[6]
+            duration = value[7] * 10 if command == 2 else 0
+            self._cancel_operations()
+            with self._lock:
+                self._left, self._right = l_power, r_power
+                self._motor_token += 1
+                token = self._motor_token
+            if duration > 0:
+                self._provider._scheduler.call_later(
+                    duration, lambda: self._stop_motor(token)
+                )
+        elif command in (3, 4):
+            response_type = 0x83 if command == 3 else 0x84
+            num_targets = 1 if command == 3 else (len(value) - 8) // 6
+            append = command == 4 and value[7] == 1
+            operation_ms = num_targets * self._provider.move_to_target_ms
+            if not append:
+                self._cancel_operations()
+            with self._lock:
+                self._operations.append((value[1], response_type, operation_ms))
+                start = len(self._operations) == 1
+            if start:
+                self._start_operation()
+
+    def _stop_motor(self, token: int):
+        with self._lock:
+            if self._motor_token == token:
+                self._left = self._right = 0
+
+    def _cancel_operations(self):
+        with self._lock:
+            cancelled = self._operations
+            self._operations = []
+        for operation_id, response_type, _ in cancelled:
+            self._motor_characteristic._notify(
+                bytes([response_type, operation_id, 0x05])
+            )
+
+    def _start_operation(self):
+        with self._lock:
+            if not self._operations:
+                return
+            operation = self._operations[0]
+
+        def complete():
+            with self._lock:
+                if not self._operations or self._operations[0] is not operation:
+                    return
+                self._operations.pop(0)
+            self._motor_characteristic._notify(
+                bytes([operation[1], operation[0], 0x00])
+            )
+            self._start_operation()
+
+        self._provider._scheduler.call_later(operation[2], complete)
+
+
+class SimulatedAdapter(Adapter):
+    def __init__(self):
+        self._powered = False
+        self._scanning = False
+
+    @property
+    def is_powered(self) -> bool:
+        return self._powered
+
+    def power_on(self):
+        self._powered = True
+
+    def power_off(self):
+        self._powered = False
+
+    def start_scan(self, timeout_sec: float = TIMEOUT_SEC):
+        self._scanning = True
+
+    def stop_scan(self, timeout_sec: float = TIMEOUT_SEC):
+        self._scanning = False
+
+
+class SimulatedProvider(Provider):
+    def __init__(
+        self,
+        cube_count: int = 1,
+        position_id_rate_hz: float = 100,
+        sensor_rate_hz: float = 10,
+        write_latency_ms: float = 0,
+        packet_loss: float = 0.0,
+        connect_latency_ms: float = 0,
+        move_to_target_ms: float = 100,
+        seed: Optional[int] = None,
+    ):
+        self.position_id_rate_hz = position_id_rate_hz
+        self.sensor_rate_hz = sensor_rate_hz
+        self.write_latency_ms = write_latency_ms
+        self.packet_loss = packet_loss
+        self.connect_latency_ms = connect_latency_ms
+        self.move_to_target_ms = move_to_target_ms
+
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._scheduler = SimulatorScheduler()
+        self._adapter = SimulatedAdapter()
+        self._devices = [SimulatedDevice(self, i) for i in range(cube_count)]
+
+    @property
+    def devices(self) -> List[SimulatedDevice]:
+        return list(self._devices)
+
+    def initialize(self):
+        self._scheduler.start()
+
+    def shutdown(self):
+        for device in self._devices:
+            device.disconnect()
+        self._scheduler.stop()
+
+    def run_mainloop_with(self, target: Callable):
+        self.initialize()
+        try:
+            return target()
+        finally:
+            self.shutdown()
+
+    def clear_cached_data(self):
+        pass
+
+    def get_default_adapter(self) -> Adapter:
+        return self._adapter
+
+    def disconnect_devices(self, service_uuids: List[UUID]):
+        for device in self._devices:
+            device.disconnect()
+
+    def find_devices(
+        self, service_uuids: List[UUID] = [], name: Optional[str] = None
+    ) -> List[Device]:
+        return [
+            device for device in self._devices if name is None or device.name == name
+        ]
+
+    def _lost(self) -> bool:
+        if self.packet_loss <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.packet_loss
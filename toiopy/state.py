@@ -0,0 +1,76 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from toiopy.provider import GattCharacteristic
+
+
+class StateCache:
+    # 通知で受け取った最新の生データと受信時刻をcharacteristicごとに保持する
+    # 解析は取得時に行い、通知のコールバックではコピーして保存するだけにする
+    # max_age_msより古いデータは無効とし、getterはGATTの読み出しにフォールバックする
+    # MAX_AGE_MSは電池の通知間隔(5秒)を踏まえた目安の値
+    BATTERY = "battery"
+    BUTTON = "button"
+    SENSOR = "sensor"
+
+    MAX_AGE_MS = 10000
+
+    def __init__(self, max_age_ms: Optional[float] = MAX_AGE_MS):
+        # Noneの場合はキャッシュを使わず、常に読み出す
+        self.max_age_ms = max_age_ms
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[bytes, float]] = {}
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def update(self, key: str, data):
+        # 呼び出し元のバッファが再利用されても壊れないようbytesにしておく
+        entry = (bytes(data), time.monotonic())
+        with self._lock:
+            self._entries[key] = entry
+
+    def get(self, key: str, max_age_ms: Optional[float] = None) -> Optional[bytes]:
+        if max_age_ms is None:
+            max_age_ms = self.max_age_ms
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and max_age_ms is not None
+                and (time.monotonic() - entry[1]) * 1000 <= max_age_ms
+            ):
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            return None
+
+    def read(
+        self,
+        key: str,
+        characteristic: GattCharacteristic,
+        max_age_ms: Optional[float] = None,
+    ):
+        # 新しいデータがあればそれを返し、なければ読み出した値でキャッシュを更新する
+        data = self.get(key, max_age_ms)
+        if data is None:
+            data = characteristic.read_value()
+            if data:
+                self.update(key, data)
+        return data
+
+    def age_ms(self, key: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+        return (time.monotonic() - entry[1]) * 1000 if entry is not None else None
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Optional
+
+from toiopy.data import ToioException
+
+try:
+    import numpy as np
+except ImportError:  # numpyは任意の依存とする
+    np = None  # type: ignore
+
+
+POSITION_DTYPE = (
+    np.dtype(
+        [
+            ("timestamp", "<f8"),
+            ("x", "<u2"),
+            ("y", "<u2"),
+            ("angle", "<u2"),
+            ("sensor_x", "<u2"),
+            ("sensor_y", "<u2"),
+            ("missed", "?"),
+        ]
+    )
+    if np is not None
+    else None
+)
+
+
+class PositionRingBuffer:
+    def __init__(self, capacity: int):
+        if np is None:
+            raise ToioException("numpy is required for PositionRingBuffer")
+        if capacity <= 0:
+            raise ToioException("invalid argument: capacity must be positive")
+
+        self._capacity = capacity
+        # 同じレコードを前半と後半の2箇所に書き込み、
+        # 折り返しを跨いでも常に連続したビューを返せるようにする
+        self._records = np.zeros(capacity * 2, dtype=POSITION_DTYPE)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(
+        self,
+        x: int,
+        y: int,
+        angle: int,
+        sensor_x: int,
+        sensor_y: int,
+        timestamp: Optional[float] = None,
+    ):
+        row = (
+            time.time() if timestamp is None else timestamp,
+            x,
+            y,
+            angle,
+            sensor_x,
+            sensor_y,
+            False,
+        )
+        self._append(row)
+
+    def record_missed(self, timestamp: Optional[float] = None):
+        row = (time.time() if timestamp is None else timestamp, 0, 0, 0, 0, 0, True)
+        self._append(row)
+
+    def snapshot(self):
+        # 古い順に並んだビューを返す。コピーしないため、保持する場合は
+        # 後続の書き込みで上書きされる前に呼び出し側でcopy()すること
+        with self._lock:
+            end = self._head + self._capacity
+            return self._records[end - self._count : end]
+
+    def clear(self):
+        with self._lock:
+            self._head = 0
+            self._count = 0
+
+    def _append(self, row: tuple):
+        with self._lock:
+            index = self._head
+            self._records[index] = row
+            self._records[index + self._capacity] = row
+            self._head = (index + 1) % self._capacity
+            if self._count < self._capacity:
+                self._count += 1
@@ -1,18 +1,126 @@
+import heapq
+import itertools
+import logging
 import threading
-from typing import Callable
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
 import math
+import re
+
+logger = logging.getLogger(__name__)
 
 
 def clamp(value: int, min_value: int, max_value: int) -> int:
     return math.ceil(max([min([value, max_value]), min_value]))
 
 
+def parse_version(version: str) -> Tuple[int, ...]:
+    # "2.10.0"のような文字列を整数のタプルにして比較できるようにする
+    # 各部分の先頭の数字だけを使い、数字で始まらない部分以降は無視する
+    numbers = []
+    for part in version.strip().split("."):
+        match = re.match(r"\d+", part)
+        if match is None:
+            break
+        numbers.append(int(match.group()))
+    return tuple(numbers)
+
+
 def set_timeout(task: Callable, delay_ms: int = 0):
     t = threading.Timer(delay_ms / 1000, task)
     t.start()
-    t.join()
     return t
 
 
 def clear_timeout(timer):
     timer.cancel()
+
+
+class ScheduledTask:
+    __slots__ = ("task", "cancelled")
+
+    def __init__(self, task: Callable):
+        self.task = task
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    # 1本のスレッドと期限順のヒープで遅延実行する
+    # コマンドごとにTimerのスレッドを作らないためのもので、コールバックはこのスレッドで
+    # 順に実行されるため、完了の通知や1回の書き込みのような短い処理に限る
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap: List[Tuple[float, int, ScheduledTask]] = []
+        self._counter = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def call_later(self, delay_ms: float, task: Callable) -> ScheduledTask:
+        entry = ScheduledTask(task)
+        deadline = time.monotonic() + delay_ms / 1000
+        with self._condition:
+            heapq.heappush(self._heap, (deadline, next(self._counter), entry))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            # 先頭が変わった場合に待ち時間を計算し直させる
+            self._condition.notify()
+        return entry
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    deadline, _, entry = self._heap[0]
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        heapq.heappop(self._heap)
+                        break
+                    self._condition.wait(remaining)
+            if entry.cancelled:
+                continue
+            try:
+                entry.task()
+            except Exception as e:
+                logger.warning("scheduled task failed: %s", e)
+
+
+_scheduler = Scheduler()
+
+
+def call_later(task: Callable, delay_ms: float = 0) -> ScheduledTask:
+    # 共有のSchedulerのスレッドで実行する。通知のコールバックの外で書き込む場合にも使う
+    return _scheduler.call_later(delay_ms, task)
+
+
+class TimeoutFuture(Future):
+    # duration経過でTrue、新しいコマンドで置き換えられた場合はFalseで完了する
+    # delay_msがNoneの場合は終わりのないコマンドとして、置き換えられるまで完了しない
+    def __init__(self, delay_ms: Optional[int] = 0):
+        super(TimeoutFuture, self).__init__()
+        self._lock = threading.Lock()
+        self._timer: Optional[ScheduledTask] = None
+
+        if delay_ms is None:
+            return
+        if delay_ms > 0:
+            self._timer = _scheduler.call_later(delay_ms, lambda: self._finish(True))
+        else:
+            self._finish(True)
+
+    def replace(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._finish(False)
+
+    def _finish(self, completed: bool):
+        with self._lock:
+            if not self.done():
+                self.set_result(completed)
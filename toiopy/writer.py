@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from toiopy.metrics import CubeMetrics
+from toiopy.provider import WRITE_WITHOUT_RESPONSE, GattCharacteristic
+
+logger = logging.getLogger(__name__)
+
+
+class CharacteristicWriter:
+    # characteristicごとの送信キュー
+    # max_rate_hzがNoneの場合は呼び出し元のスレッドでそのまま書き込む。
+    # 数値を指定するとキューを介して専用スレッドから送信し、0の場合は送信間隔を制限しない
+    # coalesce_keyを持つ書き込みは、キュー末尾が同じkeyの未送信の書き込みであれば
+    # それを置き換える(latest-wins)。keyを持たない書き込みは置き換えず順序を保つ
+    # キューが一杯の場合はkeyを持つ最も古い書き込みを捨てる。keyを持つものがなければ
+    # 空きができるまで呼び出し元を待たせ、move_toの目標などを取りこぼさないようにする
+    # without_responseはwrite_typeを受け付けるバックエンドでのみ有効となる
+    def __init__(
+        self,
+        characteristic: GattCharacteristic,
+        max_rate_hz: Optional[float] = None,
+        max_queue_size: int = 32,
+        without_response: bool = False,
+        metrics: Optional[CubeMetrics] = None,
+    ):
+        self._characteristic = characteristic
+        self._metrics = metrics or CubeMetrics()
+        self._without_response = without_response
+        self._supports_write_type = True
+        self._queued = max_rate_hz is not None
+        self._interval_sec = 1 / max_rate_hz if max_rate_hz else 0.0
+        self._max_queue_size = max_queue_size
+        self._queue: Deque[List] = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # open/closeのたびに進め、以前の送信スレッドを終了させる
+        self._generation = 0
+        self._last_sent = 0.0
+        self._stats: Dict[str, int] = {
+            "submitted": 0,
+            "sent": 0,
+            "sent_without_response": 0,
+            "coalesced": 0,
+            "dropped": 0,
+        }
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return dict(self._stats)
+
+    def write(
+        self,
+        value,
+        coalesce_key: Optional[str] = None,
+        without_response: Optional[bool] = None,
+    ):
+        if without_response is None:
+            without_response = self._without_response
+
+        if not self._queued:
+            with self._condition:
+                self._stats["submitted"] += 1
+            self._send(value, without_response)
+            return
+
+        with self._condition:
+            if self._closed:
+                self._stats["submitted"] += 1
+                self._stats["dropped"] += 1
+                return
+            self._stats["submitted"] += 1
+            if (
+                coalesce_key is not None
+                and self._queue
+                and self._queue[-1][0] == coalesce_key
+            ):
+                self._queue[-1][1:] = [value, without_response]
+                self._stats["coalesced"] += 1
+            else:
+                if len(self._queue) >= self._max_queue_size and not self._evict():
+                    self._start()
+                    generation = self._generation
+                    while (
+                        len(self._queue) >= self._max_queue_size
+                        and self._generation == generation
+                    ):
+                        self._condition.wait()
+                    if self._generation != generation:
+                        self._stats["dropped"] += 1
+                        return
+                self._queue.append([coalesce_key, value, without_response])
+            self._start()
+            self._condition.notify_all()
+
+    def _evict(self) -> bool:
+        # keyを持つ最も古い書き込みを捨てる
+        for index, entry in enumerate(self._queue):
+            if entry[0] is not None:
+                del self._queue[index]
+                self._stats["dropped"] += 1
+                return True
+        return False
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, args=(self._generation,), daemon=True
+            )
+            self._thread.start()
+
+    def open(self):
+        # closeした書き込みを再び受け付ける。再接続時に使う
+        with self._condition:
+            if not self._closed:
+                return
+            self._closed = False
+            self._generation += 1
+            self._thread = None
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._generation += 1
+            self._stats["dropped"] += len(self._queue)
+            self._queue.clear()
+            self._condition.notify_all()
+
+    def _run(self, generation: int):
+        while True:
+            with self._condition:
+                while (
+                    not self._queue
+                    and not self._closed
+                    and self._generation == generation
+                ):
+                    self._condition.wait()
+                if self._closed or self._generation != generation:
+                    return
+                # 送信間隔を待つ間に届いた書き込みも末尾で置き換えられるよう、
+                # 取り出す前に待つ
+                wait_sec = self._last_sent + self._interval_sec - time.perf_counter()
+                if wait_sec > 0:
+                    self._condition.wait(wait_sec)
+                    continue
+                _, value, without_response = self._queue.popleft()
+                self._last_sent = time.perf_counter()
+                # 空きを待っている呼び出し元を起こす
+                self._condition.notify_all()
+
+            try:
+                self._send(value, without_response)
+            except Exception as e:
+                logger.warning("failed to write %s: %s", self._characteristic.uuid, e)
+
+    def _send(self, value, without_response: bool):
+        unacknowledged = without_response and self._supports_write_type
+        try:
+            if unacknowledged:
+                try:
+                    self._characteristic.write_value(value, WRITE_WITHOUT_RESPONSE)
+                except TypeError:
+                    # BlueZ版はwrite_typeを受け付けないため以降は通常の書き込みにする
+                    self._supports_write_type = False
+                    unacknowledged = False
+            if not unacknowledged:
+                self._characteristic.write_value(value)
+        except Exception:
+            self._metrics.increment(CubeMetrics.WRITE_FAILURES)
+            raise
+        self._metrics.increment(CubeMetrics.WRITES)
+        with self._condition:
+            self._stats["sent"] += 1
+            if unacknowledged:
+                self._stats["sent_without_response"] += 1